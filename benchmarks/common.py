@@ -0,0 +1,95 @@
+import gzip
+import json
+import time
+from collections import Counter
+
+# operation fields holding account names, the accounts the fake node knows.
+ACCOUNT_FIELDS = [
+    "account", "author", "parent_author", "voter", "from", "to", "curator",
+    "comment_author", "owner", "creator", "new_account_name", "delegator",
+    "delegatee", "producer", "publisher", "witness",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile. `values` does not need to be sorted."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(int(round(pct / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def load_corpus(path):
+    """Reads a corpus written by `python -m benchmarks.ingest record`."""
+    blocks = []
+    with gzip.open(path, "rt") as f:
+        header = json.loads(f.readline())
+        for line in f:
+            blocks.append(json.loads(line))
+    return header, blocks
+
+
+class CountingProxy(object):
+    """Counts and times every method call made on the wrapped object."""
+
+    def __init__(self, target):
+        self._target = target
+        self.calls = Counter()
+        self.call_time = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.calls[name] += 1
+                self.call_time[name] += time.time() - start
+        return wrapper
+
+
+class FakeSteemNode(object):
+    """Stands in for a steemd node, answering from a recorded corpus. No
+    network access."""
+
+    def __init__(self, header, blocks):
+        self.config = header["config"]
+        self.properties = header["properties"]
+        self.blocks = {b["block_num"]: b for b in blocks}
+        self.head_block_number = max(self.blocks) if self.blocks else 0
+        self.accounts = set()
+        for block in blocks:
+            for operation in block["ops"]:
+                op_value = operation["op"][1]
+                self.accounts.update(
+                    op_value[field] for field in ACCOUNT_FIELDS
+                    if isinstance(op_value.get(field), str))
+
+    def get_config(self):
+        return self.config
+
+    def get_dynamic_global_properties(self):
+        properties = dict(self.properties)
+        properties["head_block_number"] = self.head_block_number
+        properties["last_irreversible_block_num"] = self.head_block_number
+        return properties
+
+    def get_block(self, block_num):
+        block = self.blocks.get(block_num)
+        if block:
+            return block["block"]
+
+    def get_ops_in_block(self, block_num, virtual_only=False):
+        block = self.blocks.get(block_num)
+        if not block:
+            return []
+        return block["ops"]
+
+    def get_accounts(self, usernames):
+        return [{"name": username} for username in usernames
+                if username in self.accounts]
@@ -0,0 +1,148 @@
+"""
+Ingest benchmark for TransactionListener.
+
+Blocks and get_ops_in_block responses are replayed from a recorded corpus
+through a local stand-in node, so nothing touches the network. Blocks are
+persisted into the database configured in local_settings.DB_INFO, which
+should point to a throwaway MySQL loaded with sql/base.sql, e.g.:
+
+    $ docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=pass mysql:5.7
+    $ mysql -h 127.0.0.1 -u root -ppass < sql/base.sql
+
+Record a corpus once (this one talks to the configured nodes):
+
+    $ python -m benchmarks.ingest record 20000000 1000 corpus.ndjson.gz
+
+and replay it as many times as needed:
+
+    $ python -m benchmarks.ingest run corpus.ndjson.gz
+"""
+import argparse
+import concurrent.futures
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from steemrocks import cache, settings, state
+from steemrocks.app import app
+from steemrocks.tx_listener import TransactionListener
+from steemrocks.utils import get_steem_conn
+
+from .common import CountingProxy, FakeSteemNode, load_corpus, percentile
+
+logger = logging.getLogger('steemrocks')
+
+
+def record(start_block, count, output):
+    s = get_steem_conn()
+    with gzip.open(output, "wt") as f:
+        f.write(json.dumps({
+            "config": s.get_config(),
+            "properties": s.get_dynamic_global_properties(),
+        }) + "\n")
+        for block_num in range(start_block, start_block + count):
+            f.write(json.dumps({
+                "block_num": block_num,
+                "block": s.get_block(block_num),
+                "ops": s.get_ops_in_block(block_num, virtual_only=False),
+            }) + "\n")
+    print("Recorded %s blocks into %s" % (count, output))
+
+
+def run(corpus, workers=None):
+    # the state file, redis, the rich list, the block stream and the
+    # archive of a listener on this host are left alone.
+    state_dir = tempfile.mkdtemp(prefix="steemrocks-bench-")
+    state.CONFIG_PATH = state_dir
+    state.STATE = os.path.join(state_dir, "state")
+    state.CHECKPOINT = os.path.join(state_dir, "checkpoint")
+    settings.RICHLIST_ENABLED = False
+    settings.PUBSUB_ENABLED = False
+    settings.ARCHIVE_PATH = None
+    cache._cache_backend = cache.LocalBackend()
+    try:
+        benchmark(corpus, workers)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def benchmark(corpus, workers=None):
+    header, blocks = load_corpus(corpus)
+    node = CountingProxy(FakeSteemNode(header, blocks))
+    op_count = sum(len(block["ops"]) for block in blocks)
+
+    persist_times = []
+    errors = []
+    lock = threading.Lock()
+
+    with app.app_context():
+        listener = TransactionListener(node)
+        if workers:
+            listener.thread_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers)
+        persist_block = listener.persist_block
+
+        def timed_persist_block(block_data, block_num):
+            start = time.time()
+            try:
+                persist_block(block_data, block_num)
+            except Exception as e:
+                logger.exception(e)
+                with lock:
+                    errors.append(block_num)
+            with lock:
+                persist_times.append(time.time() - start)
+
+        listener.persist_block = timed_persist_block
+
+        logger.setLevel(logging.WARNING)
+        start = time.time()
+        props = listener.properties
+        for block in blocks:
+            listener.process_block(block["block_num"], props)
+        listener.thread_pool.shutdown(wait=True)
+        elapsed = time.time() - start
+
+    block_count = len(blocks)
+    print("blocks:            %s" % block_count)
+    print("operations:        %s" % op_count)
+    print("errors:            %s" % len(errors))
+    print("elapsed:           %.2fs" % elapsed)
+    print("blocks/s:          %.2f" % (block_count / elapsed))
+    print("ops/s:             %.2f" % (op_count / elapsed))
+    print("persist p50:       %.2fms" % (percentile(persist_times, 50) * 1000))
+    print("persist p99:       %.2fms" % (percentile(persist_times, 99) * 1000))
+    print("rpc calls/block:")
+    for method, calls in sorted(node.calls.items()):
+        print("  %-30s %.2f" % (method, calls / block_count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest benchmark")
+    subparsers = parser.add_subparsers(dest="command")
+
+    record_parser = subparsers.add_parser("record")
+    record_parser.add_argument("start_block", type=int)
+    record_parser.add_argument("count", type=int)
+    record_parser.add_argument("output")
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("corpus")
+    run_parser.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.start_block, args.count, args.output)
+    elif args.command == "run":
+        run(args.corpus, workers=args.workers)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
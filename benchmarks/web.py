@@ -0,0 +1,298 @@
+"""
+Load benchmark for the web tier.
+
+Seeds the database configured in local_settings.DB_INFO with a synthetic
+history (one whale and many small accounts), replaces the steem client
+with a local stand-in and drives the profile and witness routes through
+the Flask test client from several threads:
+
+    $ python -m benchmarks.web seed --whale-ops 5000000 --accounts 1000
+    $ python -m benchmarks.web run --requests 500 --concurrency 8
+
+Use a throwaway database, seeding writes millions of rows.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pymysql
+
+from steemrocks import cache, settings, state, utils
+from steemrocks.accounts_dict import accounts_dict
+from steemrocks.app import app
+from steemrocks.utils import op_types
+
+from .common import CountingProxy, percentile
+
+WHALE = "bench-whale"
+SMALL_ACCOUNT = "bench-user-%s"
+BATCH_SIZE = 10000
+
+PROPERTIES = {
+    "head_block_number": 20000000,
+    "total_vesting_fund_steem": "190000000.000 STEEM",
+    "total_vesting_shares": "390000000000.000000 VESTS",
+    "max_virtual_bandwidth": "264241152000000000000",
+    "current_reserve_ratio": 20000,
+}
+
+
+class FakeAccountNode(object):
+    """Answers the account related calls made by the web views with
+    synthetic data."""
+
+    def account(self, username):
+        return {
+            "name": username,
+            "json_metadata": "{}",
+            "balance": "1000.000 STEEM",
+            "sbd_balance": "100.000 SBD",
+            "vesting_shares": "2000000000.000000 VESTS",
+            "delegated_vesting_shares": "1000000.000000 VESTS",
+            "received_vesting_shares": "500000.000000 VESTS",
+            "voting_power": 9000,
+            "last_vote_time": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S"),
+            "reputation": "123456789012345",
+            "average_bandwidth": "1000000000",
+            "last_bandwidth_update": datetime.utcnow().strftime(
+                "%Y-%m-%dT%H:%M:%S"),
+            "created": "2016-06-01T00:00:00",
+            "witness_votes": [],
+            "proxy": "",
+        }
+
+    def get_account(self, username):
+        return self.account(username)
+
+    def get_accounts(self, usernames):
+        return [self.account(username) for username in usernames]
+
+    def get_dynamic_global_properties(self):
+        return PROPERTIES
+
+    def get_current_median_history_price(self):
+        return {"base": "1.000 SBD", "quote": "1.000 STEEM"}
+
+    def get_reward_fund(self, name):
+        return {"reward_balance": "700000.000 STEEM",
+                "recent_claims": "400000000000000000"}
+
+
+class QueryCounter(threading.local):
+    queries = 0
+    query_time = 0.0
+
+
+query_counter = QueryCounter()
+
+
+class CountingCursor(pymysql.cursors.DictCursor):
+
+    def execute(self, query, args=None):
+        start = time.time()
+        try:
+            return super(CountingCursor, self).execute(query, args)
+        finally:
+            query_counter.queries += 1
+            query_counter.query_time += time.time() - start
+
+
+def connect_db():
+    conn = pymysql.connect(*settings.DB_INFO, charset='utf8')
+    conn.cursorclass = CountingCursor
+    return conn
+
+
+def synthetic_operations(username, count, start_id):
+    created_at = datetime(2016, 6, 1)
+    for i in range(count):
+        op_type = random.choice(["vote", "vote", "vote", "comment",
+                                 "transfer", "curation_reward"])
+        other = SMALL_ACCOUNT % random.randint(0, 999)
+        if op_type == "vote":
+            raw_data = {"voter": other, "author": username,
+                        "permlink": "post-%s" % i, "weight": 10000}
+            actor, effected = other, username
+        elif op_type == "comment":
+            raw_data = {"author": username, "permlink": "re-%s" % i,
+                        "parent_author": other, "parent_permlink": "post",
+                        "title": "", "body": "Nice post @%s" % other,
+                        "json_metadata": "{}"}
+            actor, effected = username, other
+        elif op_type == "transfer":
+            raw_data = {"from": username, "to": other,
+                        "amount": "1.000 STEEM", "memo": "bench"}
+            actor, effected = username, other
+        else:
+            raw_data = {"curator": username, "reward": "1.000000 VESTS",
+                        "comment_author": other,
+                        "comment_permlink": "post-%s" % i}
+            actor, effected = username, ""
+
+        yield (
+            start_id + i, "bench-%s" % (start_id + i), op_type,
+            json.dumps(raw_data), actor, effected,
+            created_at + timedelta(seconds=3 * i))
+
+
+def insert_operations(db, rows):
+    cursor = db.cursor()
+    batch = []
+    query = "INSERT IGNORE INTO operations " \
+            "(`block_num`, `tx_id`, `type`, `raw_data`, `actor`, " \
+            "`effected`, `created_at`, `actor_id`, `effected_id`) " \
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+    def flush(batch):
+        account_ids = accounts_dict.get_ids(
+            db, set(row[4] for row in batch) | set(row[5] for row in batch))
+        cursor.executemany(query, [
+            row + (account_ids.get(row[4]), account_ids.get(row[5]))
+            for row in batch])
+        db.commit()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+def seed(whale_ops, accounts, ops_per_account):
+    db = utils.connect_db()
+    start = time.time()
+    insert_operations(db, synthetic_operations(WHALE, whale_ops, 0))
+    for i in range(accounts):
+        insert_operations(db, synthetic_operations(
+            SMALL_ACCOUNT % i, ops_per_account,
+            whale_ops + i * ops_per_account))
+
+    witnesses = [{
+        "rank": rank, "owner": SMALL_ACCOUNT % rank, "votes_in_mv": 1000,
+        "url": "", "total_missed": 0, "last_confirmed_block_num": 1,
+        "props": {"account_creation_fee": "0.100 STEEM",
+                  "maximum_block_size": 65536, "sbd_interest_rate": 0},
+        "price": "$1.000", "price_uptodate": True, "active": True,
+        "running_version": "0.19.2",
+    } for rank in range(1, 101)]
+    utils.get_redis_conn().set("witnesses", json.dumps(witnesses))
+    print("Seeded in %.2fs" % (time.time() - start))
+
+
+def build_urls(whale_ops, accounts):
+    deep_page = max(whale_ops // 30 // 2, 1)
+    return [
+        ("profile", "/%s" % WHALE),
+        ("profile_deep_page", "/%s/page/%s" % (WHALE, deep_page)),
+        ("profile_op_type", "/%s?op_type=%s" % (
+            WHALE, random.choice(op_types[:4]))),
+        ("small_profile", "/%s" % (
+            SMALL_ACCOUNT % random.randint(0, max(accounts - 1, 0)))),
+        ("witnesses", "/witnesses"),
+    ]
+
+
+def run(requests, concurrency, whale_ops, accounts, cold):
+    # the fake properties go to a throwaway state file, the real one of a
+    # listener on this host is left alone.
+    state_dir = tempfile.mkdtemp(prefix="steemrocks-bench-")
+    state.CONFIG_PATH = state_dir
+    state.STATE = os.path.join(state_dir, "state")
+    try:
+        benchmark(requests, concurrency, whale_ops, accounts, cold)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def benchmark(requests, concurrency, whale_ops, accounts, cold):
+    utils.connect_db = connect_db
+    utils._steem_connection = CountingProxy(FakeAccountNode())
+    state.dump_state(PROPERTIES)
+
+    results = defaultdict(list)
+    lock = threading.Lock()
+
+    def worker(count):
+        client = app.test_client()
+        for _ in range(count):
+            name, url = random.choice(build_urls(whale_ops, accounts))
+            if cold:
+                cache.invalidate_account(url.split("/")[1].split("?")[0])
+            query_counter.queries = 0
+            query_counter.query_time = 0.0
+            start = time.time()
+            response = client.get(url)
+            elapsed = time.time() - start
+            with lock:
+                results[name].append((
+                    elapsed, query_counter.queries,
+                    query_counter.query_time, response.status_code))
+
+    threads = [threading.Thread(target=worker,
+                                args=(requests // concurrency,))
+               for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    total = sum(len(r) for r in results.values())
+    print("requests: %s in %.2fs (%.2f req/s)" % (
+        total, elapsed, total / elapsed))
+    print("%-20s %6s %9s %9s %9s %8s %8s" % (
+        "route", "count", "p50 ms", "p95 ms", "p99 ms", "q/req", "sql ms"))
+    for name, samples in sorted(results.items()):
+        latencies = [s[0] for s in samples]
+        print("%-20s %6s %9.2f %9.2f %9.2f %8.2f %8.2f" % (
+            name, len(samples),
+            percentile(latencies, 50) * 1000,
+            percentile(latencies, 95) * 1000,
+            percentile(latencies, 99) * 1000,
+            sum(s[1] for s in samples) / len(samples),
+            sum(s[2] for s in samples) / len(samples) * 1000))
+        errors = [s[3] for s in samples if s[3] != 200]
+        if errors:
+            print("  %s non-200 responses" % len(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web tier benchmark")
+    subparsers = parser.add_subparsers(dest="command")
+
+    seed_parser = subparsers.add_parser("seed")
+    seed_parser.add_argument("--whale-ops", type=int, default=5000000)
+    seed_parser.add_argument("--accounts", type=int, default=1000)
+    seed_parser.add_argument("--ops-per-account", type=int, default=100)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--requests", type=int, default=500)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--whale-ops", type=int, default=5000000)
+    run_parser.add_argument("--accounts", type=int, default=1000)
+    run_parser.add_argument(
+        "--cold", action="store_true",
+        help="invalidate the response cache before every request")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed(args.whale_ops, args.accounts, args.ops_per_account)
+    elif args.command == "run":
+        run(args.requests, args.concurrency, args.whale_ops, args.accounts,
+            args.cold)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
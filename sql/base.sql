@@ -95,3 +95,168 @@ DROP FOREIGN KEY `tx_id_reference`;
 
 
 ALTER TABLE `operations` ADD UNIQUE `unique_index`(`tx_id`, `type`, `actor`, `effected`);
+
+
+-- Operations are identified by their position on the chain.
+ALTER TABLE `operations`
+ADD COLUMN `block_num` BIGINT(20) NOT NULL DEFAULT 0 AFTER `id`,
+ADD COLUMN `trx_in_block` INT UNSIGNED NOT NULL DEFAULT 0 AFTER `block_num`,
+ADD COLUMN `op_in_trx` INT UNSIGNED NOT NULL DEFAULT 0 AFTER `trx_in_block`,
+ADD COLUMN `virtual_op` INT UNSIGNED NOT NULL DEFAULT 0 AFTER `op_in_trx`;
+
+-- Rows stored before the identity columns existed keep their id as
+-- op_in_trx until `flask backfill_positions` moves them to their real
+-- position, see legacy_position below.
+UPDATE `operations` o JOIN `transactions` t ON t.id = o.tx_id
+SET o.block_num = t.block_num, o.op_in_trx = o.id;
+
+ALTER TABLE `operations`
+DROP PRIMARY KEY,
+ADD PRIMARY KEY (`block_num`, `trx_in_block`, `op_in_trx`, `virtual_op`),
+ADD UNIQUE INDEX `id_UNIQUE` (`id`),
+DROP INDEX `unique_index`;
+
+
+-- Operations derived from another operation (mentions found in a comment)
+-- share its chain position and are numbered by sub_op.
+ALTER TABLE `operations`
+ADD COLUMN `sub_op` SMALLINT UNSIGNED NOT NULL DEFAULT 0 AFTER `virtual_op`,
+DROP PRIMARY KEY,
+ADD PRIMARY KEY (`block_num`, `trx_in_block`, `op_in_trx`, `virtual_op`, `sub_op`);
+
+
+-- -----------------------------------------------------
+-- Table `steemrocks`.`accounts_dict`
+-- Interned usernames. operations reference accounts by these ids.
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `accounts_dict` (
+  `id` INT UNSIGNED NOT NULL AUTO_INCREMENT,
+  `username` VARCHAR(45) NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE INDEX `username_UNIQUE` (`username`))
+ENGINE = InnoDB;
+
+ALTER TABLE `operations`
+ADD COLUMN `actor_id` INT UNSIGNED NULL AFTER `effected`,
+ADD COLUMN `effected_id` INT UNSIGNED NULL AFTER `actor_id`,
+ADD INDEX `actor_id_idx` (`actor_id`),
+ADD INDEX `effected_id_idx` (`effected_id`);
+
+INSERT IGNORE INTO `accounts_dict` (`username`)
+SELECT `actor` FROM `operations` WHERE `actor` <> ''
+UNION SELECT `effected` FROM `operations` WHERE `effected` <> '';
+
+UPDATE `operations` o JOIN `accounts_dict` a ON a.username = o.actor
+SET o.actor_id = a.id;
+
+UPDATE `operations` o JOIN `accounts_dict` a ON a.username = o.effected
+SET o.effected_id = a.id;
+
+ALTER TABLE `operations`
+DROP INDEX `actore_reference_idx`,
+DROP INDEX `effected_reference_idx`;
+
+
+-- -----------------------------------------------------
+-- Tables of the clustered listener, see coordinator.py.
+-- -----------------------------------------------------
+CREATE TABLE IF NOT EXISTS `listener_leader` (
+  `id` TINYINT UNSIGNED NOT NULL,
+  `worker` VARCHAR(64) NOT NULL,
+  `expires_at` DATETIME NOT NULL,
+  PRIMARY KEY (`id`))
+ENGINE = InnoDB;
+
+CREATE TABLE IF NOT EXISTS `listener_checkpoint` (
+  `id` TINYINT UNSIGNED NOT NULL,
+  `block_num` INT UNSIGNED NOT NULL,
+  PRIMARY KEY (`id`))
+ENGINE = InnoDB;
+
+CREATE TABLE IF NOT EXISTS `block_leases` (
+  `start_block` INT UNSIGNED NOT NULL,
+  `end_block` INT UNSIGNED NOT NULL,
+  `status` ENUM('pending', 'leased', 'done') NOT NULL DEFAULT 'pending',
+  `worker` VARCHAR(64) NULL,
+  `expires_at` DATETIME NULL,
+  PRIMARY KEY (`start_block`),
+  INDEX `status_idx` (`status`, `start_block`))
+ENGINE = InnoDB;
+
+
+-- Composite indexes for the filtered account history. Every
+-- (direction, type, date range) branch is a range scan of one of them.
+ALTER TABLE `operations`
+ADD INDEX `actor_history_idx` (`actor_id`, `type`, `created_at`),
+ADD INDEX `effected_history_idx` (`effected_id`, `type`, `created_at`),
+ADD INDEX `actor_created_idx` (`actor_id`, `created_at`),
+ADD INDEX `effected_created_idx` (`effected_id`, `created_at`),
+DROP INDEX `actor_id_idx`,
+DROP INDEX `effected_id_idx`;
+
+
+-- Operations about a post, filled by the permlinks stage. The primary
+-- key starts with the post, its activity is one range read.
+CREATE TABLE IF NOT EXISTS `post_operations` (
+  `author_id` INT UNSIGNED NOT NULL,
+  `permlink` VARCHAR(256) NOT NULL,
+  `block_num` BIGINT(20) NOT NULL,
+  `trx_in_block` INT UNSIGNED NOT NULL,
+  `op_in_trx` INT UNSIGNED NOT NULL,
+  `virtual_op` INT UNSIGNED NOT NULL,
+  `sub_op` SMALLINT UNSIGNED NOT NULL,
+  `type` VARCHAR(64) NOT NULL,
+  `created_at` DATETIME NULL,
+  PRIMARY KEY (`author_id`, `permlink`, `block_num`, `trx_in_block`,
+               `op_in_trx`, `virtual_op`, `sub_op`))
+ENGINE = InnoDB;
+
+
+-- Transfers, filled by the transfers stage. Private memos are NULL.
+CREATE TABLE IF NOT EXISTS `transfers` (
+  `block_num` BIGINT(20) NOT NULL,
+  `trx_in_block` INT UNSIGNED NOT NULL,
+  `op_in_trx` INT UNSIGNED NOT NULL,
+  `from_id` INT UNSIGNED NOT NULL,
+  `to_id` INT UNSIGNED NOT NULL,
+  `amount` DECIMAL(20, 3) NOT NULL,
+  `asset` VARCHAR(5) NOT NULL,
+  `memo` VARCHAR(2048) NULL,
+  `created_at` DATETIME NULL,
+  PRIMARY KEY (`block_num`, `trx_in_block`, `op_in_trx`),
+  INDEX `to_idx` (`to_id`),
+  INDEX `from_to_idx` (`from_id`, `to_id`),
+  FULLTEXT INDEX `memo_idx` (`memo`))
+ENGINE = InnoDB;
+
+
+-- The effected branches of the account history skip the operations of the
+-- actor branch with actor_id, it is added to their indexes after the
+-- primary key columns so they stay covering and ordered by chain position.
+ALTER TABLE `operations`
+DROP INDEX `effected_history_idx`,
+DROP INDEX `effected_created_idx`,
+ADD INDEX `effected_history_idx` (`effected_id`, `type`, `created_at`,
+  `block_num`, `trx_in_block`, `op_in_trx`, `virtual_op`, `sub_op`,
+  `actor_id`),
+ADD INDEX `effected_created_idx` (`effected_id`, `created_at`,
+  `block_num`, `trx_in_block`, `op_in_trx`, `virtual_op`, `sub_op`,
+  `actor_id`);
+
+
+-- Operations whose position is still their id (stored before the chain
+-- position primary key). `flask backfill_positions` reads their blocks
+-- again and moves them to the real position, or deletes them when the
+-- block was replayed since.
+ALTER TABLE `operations`
+ADD COLUMN `legacy_position` TINYINT(1) NOT NULL DEFAULT 0 AFTER `sub_op`,
+ADD INDEX `legacy_position_idx` (`legacy_position`, `block_num`);
+
+UPDATE `operations` SET `legacy_position` = 1
+WHERE `op_in_trx` = `id` AND `trx_in_block` = 0 AND `virtual_op` = 0
+AND `sub_op` = 0 AND `type` <> 'mention';
+
+
+-- The garbage collector deletes the post operations by block range.
+ALTER TABLE `post_operations`
+ADD INDEX `block_num_idx` (`block_num`);
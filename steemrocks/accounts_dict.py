@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+
+from . import settings
+
+
+class AccountsDict(object):
+    """Interns usernames into the accounts_dict table, so operations can
+    reference accounts with 4 byte ids. Name to id mappings never change,
+    the most recently used ones are kept in memory."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get_cached(self, username):
+        with self.lock:
+            account_id = self.ids.get(username)
+            if account_id:
+                self.ids.move_to_end(username)
+            return account_id
+
+    def _cache(self, username, account_id):
+        with self.lock:
+            self.ids[username] = account_id
+            self.ids.move_to_end(username)
+            if len(self.ids) > self.max_size:
+                self.ids.popitem(last=False)
+
+    def get_id(self, db_conn, username, create=True):
+        if not username:
+            return None
+        return self.get_ids(db_conn, [username], create=create).get(username)
+
+    def get_ids(self, db_conn, usernames, create=True):
+        """Returns {username: id}. Unknown usernames are inserted, unless
+        create is False, then they are left out."""
+        ids = {}
+        missing = set()
+        for username in usernames:
+            if not username:
+                continue
+            account_id = self._get_cached(username)
+            if account_id:
+                ids[username] = account_id
+            else:
+                missing.add(username)
+
+        if not missing:
+            return ids
+
+        missing = sorted(missing)
+        cursor = db_conn.cursor()
+        if create:
+            cursor.executemany(
+                "INSERT IGNORE INTO accounts_dict (`username`) VALUES (%s)",
+                missing)
+            db_conn.commit()
+        cursor.execute(
+            "SELECT id, username FROM accounts_dict WHERE username IN "
+            "(%s)" % ", ".join(["%s"] * len(missing)), missing)
+        for row in cursor:
+            ids[row["username"]] = row["id"]
+            self._cache(row["username"], row["id"])
+        return ids
+
+
+accounts_dict = AccountsDict(settings.ACCOUNTS_DICT_CACHE_SIZE)
@@ -0,0 +1,212 @@
+import json
+from functools import wraps
+
+from flask import Blueprint, Response, abort, request
+from steem.account import Account as SteemAccount
+
+from . import cache, metrics, settings, transfers
+from .models import Account
+from .utils import (
+    get_db, get_steem_conn, get_curation_rewards, get_delegations,
+    get_incoming_delegations, get_witness_list, op_types,
+    format_history_cursor, parse_history_cursor
+)
+
+api = Blueprint('api', __name__)
+
+MAX_LIMIT = 100
+
+
+def api_response(f):
+    """Serializes the view's return value as JSON and keeps the body in the
+    response cache, keyed by the endpoint, the account version and the
+    query string."""
+    @wraps(f)
+    def decorated(**kwargs):
+        username = kwargs.get("username", "").replace("@", "")
+        key = "api:%s:%s:%s:%s" % (
+            request.endpoint,
+            username,
+            cache.account_version(username) if username else 0,
+            request.query_string.decode("utf-8"))
+
+        backend = cache.get_cache()
+        body = backend.get(key)
+        metrics.record_cache("api", body is not None)
+        if body is None:
+            body = json.dumps(f(**kwargs), default=str)
+            backend.set(key, body, settings.API_CACHE_TTL)
+
+        response = Response(body, mimetype="application/json")
+        response.headers["Cache-Control"] = \
+            "public, max-age=%s" % settings.API_CACHE_TTL
+        return response
+    return decorated
+
+
+def load_account(username):
+    account = Account(username, get_steem_conn()).set_account_deta()
+    if not account.account_data:
+        abort(404)
+    return account
+
+
+def serialize_account(account):
+    return {
+        "username": account.username,
+        "avatar": account.avatar,
+        "reputation": account.reputation,
+        "balances": account.balances,
+        "sp": account.sp,
+        "delegated_sp": account.delegated_sp,
+        "received_sp": account.received_sp,
+        "total_sp": account.total_sp,
+        "voting_power": float(account.voting_power),
+        "creation_date": account.creation_date.isoformat(),
+    }
+
+
+def serialize_operation(operation):
+    return {
+        "id": operation.id,
+        "tx_id": operation.tx_id,
+        "virtual": operation.trx_id == "virtual operation",
+        "type": operation.type,
+        "actor": operation.actor,
+        "effected": operation.effected,
+        "created_at": operation.created_at,
+        "data": operation.raw_data,
+    }
+
+
+@api.route('/accounts/<username>')
+@api_response
+def account_summary(username):
+    return serialize_account(load_account(username.replace("@", "")))
+
+
+@api.route('/accounts/<username>/operations')
+@api_response
+def operations(username):
+    account = load_account(username.replace("@", ""))
+
+    op_type = request.args.get("op_type")
+    if op_type not in op_types:
+        op_type = None
+    limit = min(max(request.args.get("limit", 30, type=int), 1), MAX_LIMIT)
+
+    operations = account.get_operations_before(
+        before=parse_history_cursor(request.args.get("cursor")),
+        limit=limit, op_type=op_type)
+
+    next_cursor = None
+    if len(operations) == limit:
+        next_cursor = format_history_cursor(operations[-1].position)
+
+    return {
+        "account": account.username,
+        "op_type": op_type,
+        "operations": [serialize_operation(op) for op in operations],
+        "next_cursor": next_cursor,
+    }
+
+
+def transfers_response(results, limit, **query):
+    next_cursor = None
+    if len(results) == limit:
+        next_cursor = transfers.format_cursor(results[-1])
+    for transfer in results:
+        transfer["amount"] = float(transfer["amount"])
+    query.update({"transfers": results, "next_cursor": next_cursor})
+    return query
+
+
+@api.route('/accounts/<username>/transfers')
+@api_response
+def account_transfers(username):
+    username = username.replace("@", "")
+    direction = request.args.get("direction")
+    if direction not in transfers.directions:
+        direction = "any"
+    limit = min(max(request.args.get("limit", 30, type=int), 1), MAX_LIMIT)
+    results = transfers.search_transfers(
+        get_db(), account=username,
+        counterparty=request.args.get("counterparty"),
+        direction=direction,
+        memo=request.args.get("memo"),
+        asset=request.args.get("asset"),
+        before=transfers.parse_cursor(request.args.get("cursor")),
+        limit=limit)
+    return transfers_response(
+        results, limit, account=username, direction=direction)
+
+
+@api.route('/transfers/search')
+@api_response
+def search_transfers():
+    memo = request.args.get("memo")
+    if not transfers.memo_phrase(memo):
+        abort(400)
+    limit = min(max(request.args.get("limit", 30, type=int), 1), MAX_LIMIT)
+    results = transfers.search_transfers(
+        get_db(), memo=memo,
+        asset=request.args.get("asset"),
+        before=transfers.parse_cursor(request.args.get("cursor")),
+        limit=limit)
+    return transfers_response(results, limit, memo=memo)
+
+
+@api.route('/accounts/<username>/bandwidth')
+@api_response
+def bandwidth(username):
+    account = load_account(username.replace("@", ""))
+    return {
+        "account": account.username,
+        "bandwidth": account.bandwidth._asdict(),
+    }
+
+
+@api.route('/accounts/<username>/delegations/out')
+@api_response
+def delegations(username):
+    username = username.replace("@", "")
+    outgoing_delegations, expiring_delegations = get_delegations(
+        get_steem_conn(), username)
+    return {
+        "account": username,
+        "outgoing_delegations": outgoing_delegations,
+        "expiring_delegations": expiring_delegations,
+    }
+
+
+@api.route('/accounts/<username>/delegations/in')
+@api_response
+def incoming_delegations(username):
+    username = username.replace("@", "")
+    return {
+        "account": username,
+        "incoming_delegations": get_incoming_delegations(username),
+    }
+
+
+@api.route('/accounts/<username>/curation_rewards')
+@api_response
+def curation_rewards(username):
+    username = username.replace("@", "")
+    s = get_steem_conn()
+    total_sp, total_rshares, checkpoints = get_curation_rewards(
+        SteemAccount(username, steemd_instance=s),
+        s.get_dynamic_global_properties(),
+        checkpoint_val=request.args.get("checkpoint", 100, type=int))
+    return {
+        "account": username,
+        "total_sp": round(total_sp, 2),
+        "total_rshares": total_rshares,
+        "checkpoints": checkpoints,
+    }
+
+
+@api.route('/witnesses')
+@api_response
+def witnesses():
+    return {"witnesses": get_witness_list()}
@@ -1,24 +1,50 @@
-from flask import Flask, render_template, request, redirect, abort, g, url_for
+from flask import (
+    Flask, request, redirect, abort, g, url_for, Response, stream_with_context
+)
 
 from .tx_listener import listen
+from .coordinator import listen_cluster as run_listen_cluster
 from .garbage_collector import gc
+from .reindex import reindex as run_reindex
+from .positions import backfill_positions as run_backfill_positions
 from .models import Account
+from .cache import cached_page, left_menu
 from steem.account import Account as SteemAccount
-from steem.amount import Amount
 from .utils import (
-    get_steem_conn, Pagination, vests_to_sp, get_curation_rewards,
-    get_mongo_conn, op_types, prepare_witness_leaderboard, get_witness_list
+    get_db, get_steem_conn, Pagination, get_curation_rewards,
+    get_delegations, get_incoming_delegations, op_types,
+    prepare_witness_leaderboard, get_witness_list, history_directions,
+    history_filters, history_filters_query, matches_history_filters,
+    format_history_cursor, parse_history_cursor
 )
-from .settings import SITE_URL
-from . import state
+from .settings import SITE_URL, INTERFACE_LINK
+from .api import api
+from . import cache, metrics, settings, tracing
+from .pubsub import account_streams
+from .voting import get_vote_value_ranking, prepare_vote_value_ranking
+from . import permlinks, richlist
+from .tracing import render_template
 from dateutil.parser import parse
-from datetime import datetime, timedelta
+from datetime import datetime
 from time import time
 
 import bleach
+import click
+import csv
+import io
+import json
+import queue
 import requests
 
 app = Flask(__name__)
+app.register_blueprint(api, url_prefix='/api/v1')
+metrics.init_app(app)
+tracing.init_app(app)
+
+if settings.PUBSUB_ENABLED:
+    @app.before_first_request
+    def subscribe_invalidations():
+        cache.subscribe_invalidations()
 
 PER_PAGE = 30
 
@@ -33,6 +59,16 @@ def listen_transactions():
     listen()
 
 
+@app.cli.command()
+def listen_cluster():
+    """
+    Starts a listener worker which leases block ranges through MySQL, so
+    several of them can run on different hosts.
+    $ flask listen_cluster
+    """
+    run_listen_cluster()
+
+
 @app.cli.command()
 def garbage_collector():
     """
@@ -48,6 +84,50 @@ def witness_leaderboard():
     prepare_witness_leaderboard()
 
 
+@app.cli.command()
+def reconcile_richlist():
+    """
+    Refreshes the rich list of every known account from the node.
+    $ flask reconcile_richlist
+    """
+    richlist.reconcile(get_steem_conn())
+
+
+@app.cli.command()
+def vote_value_ranking():
+    """
+    Ranks the recently voting accounts by the value of their votes.
+    $ flask vote_value_ranking
+    """
+    prepare_vote_value_ranking()
+
+
+@app.cli.command()
+@click.option('--source', type=click.Choice(['db', 'archive']), default='db')
+@click.option('--chunk-size', default=10000)
+@click.option('--workers', default=None, type=int)
+@click.option('--restart', is_flag=True,
+              help='Ignore the checkpoint of the previous run.')
+def reindex(source, chunk_size, workers, restart):
+    """
+    Recomputes actor/effected and the derived tables of the stored
+    operations. Resumes from the last checkpoint unless --restart is given.
+    $ flask reindex --source archive
+    """
+    run_reindex(source=source, chunk_size=chunk_size, workers=workers,
+                restart=restart)
+
+
+@app.cli.command()
+def backfill_positions():
+    """
+    Moves the operations stored before the chain position primary key to
+    their real position. Run it before replaying or reindexing old blocks.
+    $ flask backfill_positions
+    """
+    run_backfill_positions(get_steem_conn())
+
+
 @app.route('/')
 def index():
     if request.query_string and request.args.get('account'):
@@ -88,13 +168,11 @@ def rewards(username):
 
     print(posts_as_str)
     if posts_as_str:
-
-        import time as za
-        start = za.time()
+        start = time()
         r = requests.post("http://estimator.steem.rocks/rewards.json",
                           data={"links": posts_as_str})
-        end = za.time()
-        print(end - start)
+        metrics.ESTIMATOR_LATENCY.labels("rewards").observe(
+            time() - start)
 
         rewards = r.json()["rewards"]
 
@@ -145,33 +223,45 @@ def rewards(username):
 
 @app.route('/<username>', defaults={'page': 1})
 @app.route('/<username>/page/<int:page>')
+@cached_page()
 def profile(username, page):
     if username.startswith("@"):
         username = username.replace("@", "")
 
-    op_type = None
-    if request.query_string and request.args.get('op_type'):
-        op_type = request.args.get("op_type")
-        if op_type not in op_types:
-            op_type = None
+    filters = history_filters(request.args)
 
     account = Account(username, get_steem_conn()).set_account_deta()
     if not account.account_data:
         abort(404)
 
-    page = page - 1
-    start = page * PER_PAGE
-    pagination = Pagination(page, PER_PAGE,
-                            account.get_operation_count(op_type=op_type))
-
-    operations = account.get_operations(start=start, end=PER_PAGE,
-                                        op_type=op_type)
+    # the numbered pages stop at MAX_COUNTED_OPERATIONS, the older
+    # operations are paged with the position of the last operation shown.
+    before = parse_history_cursor(request.args.get("cursor"))
+    if before:
+        pagination = None
+        operations = account.search_operations(
+            filters, limit=PER_PAGE, before=before)
+        more = len(operations) == PER_PAGE
+    else:
+        page = page - 1
+        start = page * PER_PAGE
+        total = account.count_operations(filters)
+        pagination = Pagination(page, PER_PAGE, total)
+        operations = account.search_operations(
+            filters, offset=start, limit=PER_PAGE)
+        more = total >= settings.MAX_COUNTED_OPERATIONS and \
+            not pagination.has_next and len(operations) == PER_PAGE
+
+    next_cursor = None
+    if more:
+        next_cursor = format_history_cursor(operations[-1].position)
 
     return render_template(
         'profile.html', account=account,
         operations=operations,
-        site_url=SITE_URL, pagination=pagination,
-        op_type=op_type, op_types=op_types)
+        site_url=SITE_URL, pagination=pagination, next_cursor=next_cursor,
+        filters=filters, filters_query=history_filters_query(filters),
+        op_types=op_types, directions=history_directions)
 
 
 @app.route('/<username>/curation_rewards')
@@ -198,82 +288,33 @@ def curation_rewards(username):
 
 @app.route('/<username>/delegations/out')
 @app.route('/@<username>/delegations/out')
+@cached_page()
 def delegations(username):
     if username.startswith("@"):
         username = username.replace("@", "")
     s = get_steem_conn()
     account = Account(username, s).set_account_deta()
 
-    outgoing_delegations = s.get_vesting_delegations(username, 0, 100)
-    eight_days_ago = datetime.utcnow() - timedelta(days=8)
-    expiring_delegations = s.get_expiring_vesting_delegations(
-        username,
-        eight_days_ago.strftime("%Y-%m-%dT%H:%M:%S"),
-        1000
-    )
-    info = state.load_state()
-    outgoing_delegations_fixed = []
-    for outgoing_delegation in outgoing_delegations:
-        created_at = parse(outgoing_delegation["min_delegation_time"])
-        amount = Amount(outgoing_delegation["vesting_shares"]).amount
-        outgoing_delegation.update({
-            "min_delegation_time": created_at,
-            "sp": round(vests_to_sp(amount, info), 2),
-            "vesting_shares": round(amount / 1e6, 4),
-        })
-        outgoing_delegations_fixed.append(outgoing_delegation)
-
-    expiring_delegations_fixed = []
-    for expiring_delegation in expiring_delegations:
-        created_at = parse(expiring_delegation["expiration"])
-        amount = Amount(expiring_delegation["vesting_shares"]).amount
-        expiring_delegation.update({
-            "expiration": created_at,
-            "sp": round(vests_to_sp(amount, info), 2),
-            "vesting_shares": round(amount / 1e6, 4),
-        })
-        expiring_delegations_fixed.append(expiring_delegation)
+    outgoing_delegations, expiring_delegations = get_delegations(
+        s, username)
 
     return render_template(
         "delegations.html",
         account=account,
-        outgoing_delegations=outgoing_delegations_fixed,
+        outgoing_delegations=outgoing_delegations,
         expiring_delegations=expiring_delegations,
     )
 
 
 @app.route('/<username>/delegations/in')
 @app.route('/@<username>/delegations/in')
+@cached_page()
 def incoming_delegations(username):
     if username.startswith("@"):
         username = username.replace("@", "")
     s = get_steem_conn()
-    mongo_conn = get_mongo_conn()
-
     account = Account(username, s).set_account_deta()
-    collection = mongo_conn["SteemData"]["Operations"]
-    info = state.load_state()
-
-    operations = list(collection.find({
-        "type": "delegate_vesting_shares",
-        "delegatee": username,
-    }).sort("timestamp"))
-
-    delegation_map = {}
-    for delegation in operations:
-        delegation_map.update(
-            {delegation["delegator"]: delegation["vesting_shares"]["amount"]})
-
-    delegation_map = {k: float(v)
-                      for k, v in delegation_map.items() if float(v) > 0}
-
-    incoming_delegations = []
-    for from_account, vests in delegation_map.items():
-        incoming_delegations.append({
-            "from": from_account,
-            "sp": round(vests_to_sp(vests, info), 2),
-            "vesting_shares":  round(vests / 1e6, 4),
-        })
+    incoming_delegations = get_incoming_delegations(username)
 
     return render_template(
         "incoming_delegations.html",
@@ -284,6 +325,7 @@ def incoming_delegations(username):
 
 @app.route('/<username>/bandwidth')
 @app.route('/@<username>/bandwidth')
+@cached_page()
 def bandwidth(username):
     if username.startswith("@"):
         username = username.replace("@", "")
@@ -293,12 +335,165 @@ def bandwidth(username):
     return render_template("bandwidth.html", account=account)
 
 
+EXPORT_FIELDS = [
+    "id", "tx_id", "type", "actor", "effected", "created_at", "raw_data"]
+
+
+@app.route('/<username>/stream')
+@app.route('/@<username>/stream')
+def stream(username):
+    """Server-sent events with the newly ingested operations of the
+    account, rendered like the profile page."""
+    username = username.replace("@", "")
+    filters = history_filters(request.args)
+    account_streams.start()
+
+    def generate():
+        ops = account_streams.open(username)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    block_ops = ops.get(
+                        timeout=settings.STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+
+                op_ids = [op_id for _, block_op_type, op_id in block_ops
+                          if op_id and (not filters["op_types"] or
+                                        block_op_type in filters["op_types"])]
+                if not op_ids:
+                    continue
+                # idle streams don't hold a database connection.
+                db = get_db(new=True)
+                try:
+                    account = Account(username, None, db_conn=db)
+                    operations = [
+                        operation for operation in
+                        account.get_operations_by_id(op_ids)
+                        if matches_history_filters(
+                            operation, username, filters)]
+                    for operation in operations:
+                        yield "event: operation\nid: %s\ndata: %s\n\n" % (
+                            operation.id, json.dumps({
+                                "id": operation.id,
+                                "type": operation.type,
+                                "html": render_template(
+                                    "operation.html", operation=operation),
+                            }))
+                finally:
+                    db.close()
+        finally:
+            account_streams.close(username, ops)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/<username>/export.ndjson')
+@app.route('/@<username>/export.ndjson')
+def export_ndjson(username):
+    username = username.replace("@", "")
+    op_type = request.args.get("op_type")
+    if op_type not in op_types:
+        op_type = None
+    account = Account(username, get_steem_conn())
+    if not account.account_id:
+        abort(404)
+
+    def generate():
+        for op in account.iter_operations(op_type=op_type):
+            op["created_at"] = str(op["created_at"])
+            op["raw_data"] = json.loads(op["raw_data"])
+            yield json.dumps(op) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition":
+                 "attachment; filename=%s.ndjson" % username})
+
+
+@app.route('/<username>/export.csv')
+@app.route('/@<username>/export.csv')
+def export_csv(username):
+    username = username.replace("@", "")
+    op_type = request.args.get("op_type")
+    if op_type not in op_types:
+        op_type = None
+    account = Account(username, get_steem_conn())
+    if not account.account_id:
+        abort(404)
+
+    def generate():
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow(EXPORT_FIELDS)
+        for op in account.iter_operations(op_type=op_type):
+            writer.writerow([op[field] for field in EXPORT_FIELDS])
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={"Content-Disposition":
+                 "attachment; filename=%s.csv" % username})
+
+
+# under /post, /@<username>/<name> is taken by the account pages.
+@app.route('/post/@<author>/<permlink>', defaults={'page': 1})
+@app.route('/post/@<author>/<permlink>/page/<int:page>')
+def post(author, permlink, page):
+    """Votes, replies, resteems and rewards of a post, served from the
+    post_operations index."""
+    db = get_db()
+    pagination = Pagination(
+        page - 1, PER_PAGE,
+        permlinks.count_post_operations(db, author, permlink))
+    operations = permlinks.get_post_operations(
+        db, author, permlink, offset=(page - 1) * PER_PAGE, limit=PER_PAGE)
+    if not operations and page == 1:
+        abort(404)
+
+    return render_template(
+        "post.html", author=author, permlink=permlink,
+        operations=operations, pagination=pagination,
+        interface_link=INTERFACE_LINK)
+
+
 @app.route('/witnesses')
 def witnesses():
 
     return render_template("witnesses.html", witnesses=get_witness_list())
 
 
+@app.route('/richlist')
+@app.route('/richlist/<int:page>')
+def richlist_page(page=1):
+    by = request.args.get("by")
+    if by not in richlist.LEADERBOARDS:
+        by = "effective_sp"
+    per_page = settings.RICHLIST_PAGE_SIZE
+    pagination = Pagination(
+        page - 1, per_page, richlist.leaderboard_size(by))
+    return render_template(
+        "richlist.html", by=by, leaderboards=richlist.LEADERBOARDS,
+        accounts=richlist.get_leaderboard(by, (page - 1) * per_page, per_page),
+        pagination=pagination)
+
+
+@app.route('/vote_values')
+def vote_values():
+
+    return render_template(
+        "vote_values.html", ranking=get_vote_value_ranking())
+
+
 @app.teardown_appcontext
 def close_db(error):
     """Closes the database again at the end of the request."""
@@ -318,3 +513,4 @@ def strip_tags(text):
 
 app.jinja_env.globals['url_for_other_page'] = url_for_other_page
 app.jinja_env.globals['clean'] = strip_tags
+app.jinja_env.globals['left_menu'] = left_menu
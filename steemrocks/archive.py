@@ -0,0 +1,233 @@
+"""
+Append-only binary archive of ingested operations.
+
+Blocks are grouped into segments of SEGMENT_SIZE blocks. Each segment has
+two files:
+
+    seg-<first block>.dat  operation records, appended as blocks arrive
+    seg-<first block>.idx  one INDEX_ENTRY per block slot:
+                           (offset in .dat, length, operation count)
+
+Every operation record is a fixed RECORD header followed by the zlib
+compressed JSON payload. Account names and operation types are interned
+into ids through names.txt and types.txt, one entry per line.
+"""
+import calendar
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from collections import namedtuple
+from datetime import datetime
+
+SEGMENT_SIZE = 100000
+
+# offset, length, operation count
+INDEX_ENTRY = struct.Struct("<QII")
+
+# type id, actor id, effected id, timestamp, trx_in_block, op_in_trx,
+# virtual_op, trx_id, payload length
+RECORD = struct.Struct("<HIIIIHI20sI")
+
+VIRTUAL_TRX_ID = b"\x00" * 20
+
+ArchivedOperation = namedtuple("ArchivedOperation", [
+    "block_num", "trx_in_block", "op_in_trx", "virtual_op", "tx_id",
+    "type", "actor", "effected", "created_at", "raw_data"])
+
+
+def segment_start(block_num):
+    return block_num - block_num % SEGMENT_SIZE
+
+
+class InternTable(object):
+    """Maps strings to ids, persisted as a line per string. Id 0 stands
+    for an empty value."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.values = [None]
+        self.ids = {}
+        self.file = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line_num, line in enumerate(f, 1):
+                if line_num >= len(self.values):
+                    self._add(line.rstrip("\n"))
+
+    def _add(self, value):
+        self.ids[value] = len(self.values)
+        self.values.append(value)
+        return self.ids[value]
+
+    def get_id(self, value):
+        if not value:
+            return 0
+        if value in self.ids:
+            return self.ids[value]
+        with self.lock:
+            if value in self.ids:
+                return self.ids[value]
+            if not self.file:
+                self.file = open(self.path, "a")
+            self.file.write(value + "\n")
+            self.file.flush()
+            return self._add(value)
+
+    def get_value(self, value_id):
+        if value_id >= len(self.values):
+            # appended by a writer after we loaded the table.
+            self.load()
+        return self.values[value_id] or ""
+
+
+class ArchiveWriter(object):
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.names = InternTable(os.path.join(path, "names.txt"))
+        self.types = InternTable(os.path.join(path, "types.txt"))
+        self.lock = threading.Lock()
+
+    def segment_paths(self, block_num):
+        base = os.path.join(
+            self.path, "seg-%010d" % segment_start(block_num))
+        return base + ".dat", base + ".idx"
+
+    def encode(self, operation):
+        trx_id = operation["trx_id"]
+        if trx_id.startswith("0000000000") or len(trx_id) != 40:
+            trx_id = VIRTUAL_TRX_ID
+        else:
+            trx_id = bytes.fromhex(trx_id)
+        payload = zlib.compress(json.dumps(operation["raw_data"]).encode())
+        return RECORD.pack(
+            self.types.get_id(operation["type"]),
+            self.names.get_id(operation["actor"]),
+            self.names.get_id(operation["effected"]),
+            calendar.timegm(operation["created_at"].utctimetuple()),
+            operation["trx_in_block"],
+            operation["op_in_trx"],
+            operation["virtual_op"],
+            trx_id,
+            len(payload)) + payload
+
+    def write_block(self, block_num, operations):
+        """Appends the operations of a block. Blocks can arrive in any
+        order, blocks already in the archive are skipped."""
+        data = b"".join(self.encode(op) for op in operations)
+        data_path, index_path = self.segment_paths(block_num)
+        slot = (block_num - segment_start(block_num)) * INDEX_ENTRY.size
+
+        with self.lock:
+            if not os.path.exists(index_path):
+                with open(index_path, "wb") as f:
+                    f.truncate(SEGMENT_SIZE * INDEX_ENTRY.size)
+
+            with open(index_path, "r+b") as index:
+                index.seek(slot)
+                _, length, count = INDEX_ENTRY.unpack(
+                    index.read(INDEX_ENTRY.size))
+                if length or count:
+                    return
+
+                with open(data_path, "ab") as f:
+                    offset = f.tell()
+                    f.write(data)
+
+                index.seek(slot)
+                index.write(INDEX_ENTRY.pack(
+                    offset, len(data), len(operations)))
+
+
+class ArchiveReader(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.names = InternTable(os.path.join(path, "names.txt"))
+        self.types = InternTable(os.path.join(path, "types.txt"))
+
+    def segments(self):
+        starts = []
+        for filename in os.listdir(self.path):
+            match = re.match(r"seg-(\d+)\.idx$", filename)
+            if match:
+                starts.append(int(match.group(1)))
+        return sorted(starts)
+
+    def iter_blocks(self, start_block=0, end_block=None, decode_payload=True):
+        """Yields (block_num, [ArchivedOperation, ...]) in block order."""
+        for first_block in self.segments():
+            if first_block + SEGMENT_SIZE <= start_block:
+                continue
+            if end_block is not None and first_block > end_block:
+                break
+            for block in self.iter_segment(
+                    first_block, start_block, end_block, decode_payload):
+                yield block
+
+    def iter_segment(self, first_block, start_block, end_block,
+                     decode_payload):
+        base = os.path.join(self.path, "seg-%010d" % first_block)
+        with open(base + ".idx", "rb") as index_file, \
+                open(base + ".dat", "rb") as data_file:
+            if os.fstat(data_file.fileno()).st_size == 0:
+                return
+            index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for slot in range(SEGMENT_SIZE):
+                    block_num = first_block + slot
+                    if block_num < start_block:
+                        continue
+                    if end_block is not None and block_num > end_block:
+                        break
+                    offset, length, count = INDEX_ENTRY.unpack_from(
+                        index, slot * INDEX_ENTRY.size)
+                    if not count:
+                        continue
+                    if offset + length > len(data):
+                        # appended after the segment was mapped.
+                        continue
+                    yield block_num, self.decode_block(
+                        block_num, data, offset, count, decode_payload)
+            finally:
+                index.close()
+                data.close()
+
+    def decode_block(self, block_num, data, offset, count, decode_payload):
+        operations = []
+        for _ in range(count):
+            (type_id, actor_id, effected_id, timestamp, trx_in_block,
+             op_in_trx, virtual_op, trx_id, payload_length) = \
+                RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            raw_data = None
+            if decode_payload:
+                raw_data = json.loads(zlib.decompress(
+                    data[offset:offset + payload_length]).decode())
+            offset += payload_length
+
+            if trx_id == VIRTUAL_TRX_ID:
+                tx_id = "vop-%s" % block_num
+            else:
+                tx_id = trx_id.hex()
+
+            operations.append(ArchivedOperation(
+                block_num, trx_in_block, op_in_trx, virtual_op, tx_id,
+                self.types.get_value(type_id),
+                self.names.get_value(actor_id),
+                self.names.get_value(effected_id),
+                datetime.utcfromtimestamp(timestamp),
+                raw_data))
+        return operations
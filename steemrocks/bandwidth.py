@@ -0,0 +1,110 @@
+"""
+Bandwidth of many accounts, computed with numpy in a single pass against
+one global properties snapshot.
+
+    batch = BandwidthBatch.from_accounts(accounts, state.load_state())
+    batch.below(10)  # accounts with less than 10% free bandwidth
+    batch.tuple(0)   # Bandwidth of the first account
+"""
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+from steem.amount import Amount
+
+from .utils import hbytes
+
+# bandwidth is averaged over a week.
+BANDWIDTH_WINDOW_SECONDS = 604800
+MAX_RESERVE_RATIO = 200000000
+
+Bandwidth = namedtuple("Bandwidth", [
+    "remaining_human",
+    "allocated_human",
+    "consumed_human",
+    "free_percent",
+    "used",
+    "remaining",
+    "potential_extra",
+    "potential_extra_human",
+    "used_human",
+    "allocated",
+])
+
+
+def vests(values):
+    return np.array([Amount(value).amount for value in values], dtype=float)
+
+
+class BandwidthBatch(object):
+
+    def __init__(self, names, vesting_shares, received_vesting_shares,
+                 delegated_vesting_shares, average_bandwidth,
+                 last_bandwidth_update, global_data, now=None):
+        self.names = list(names)
+        now = np.datetime64(now or datetime.utcnow(), "ms")
+        max_virtual_bandwidth = float(global_data["max_virtual_bandwidth"])
+        total_vesting_shares = Amount(
+            global_data["total_vesting_shares"]).amount
+
+        effective_vests = (np.asarray(vesting_shares, dtype=float) +
+                           np.asarray(received_vesting_shares, dtype=float) -
+                           np.asarray(delegated_vesting_shares, dtype=float))
+        self.allocated = (max_virtual_bandwidth * effective_vests /
+                          total_vesting_shares / 1000000)
+
+        since_update = (
+            now - np.asarray(last_bandwidth_update, dtype="datetime64[ms]")
+        ).astype(float) / 1000
+        self.used = np.where(
+            since_update < BANDWIDTH_WINDOW_SECONDS,
+            (BANDWIDTH_WINDOW_SECONDS - since_update) *
+            np.asarray(average_bandwidth, dtype=float) /
+            BANDWIDTH_WINDOW_SECONDS,
+            0) / 1000000
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.free_percent = np.round(np.where(
+                self.allocated > 0,
+                100 - 100 * self.used / self.allocated, 0), 2)
+        self.remaining = np.maximum(np.trunc(self.allocated - self.used), 0)
+        self.on_max_capacity = self.allocated * (
+            MAX_RESERVE_RATIO / global_data["current_reserve_ratio"])
+
+    @classmethod
+    def from_accounts(cls, accounts, global_data, now=None):
+        """Builds the batch out of get_accounts results."""
+        return cls(
+            [account["name"] for account in accounts],
+            vests(account["vesting_shares"] for account in accounts),
+            vests(account["received_vesting_shares"] for account in accounts),
+            vests(account["delegated_vesting_shares"]
+                  for account in accounts),
+            [float(account["average_bandwidth"]) for account in accounts],
+            [account["last_bandwidth_update"] for account in accounts],
+            global_data, now=now)
+
+    def below(self, free_percent):
+        """Names of the accounts with less free bandwidth than free_percent,
+        the emptiest first."""
+        indexes = np.flatnonzero(self.free_percent < free_percent)
+        indexes = indexes[np.argsort(self.free_percent[indexes])]
+        return [self.names[i] for i in indexes]
+
+    def tuple(self, i):
+        allocated = float(self.allocated[i])
+        used = float(self.used[i])
+        remaining = int(self.remaining[i])
+        on_max_capacity = float(self.on_max_capacity[i])
+        return Bandwidth(
+            hbytes(remaining),
+            hbytes(allocated),
+            hbytes(allocated - remaining),
+            float(self.free_percent[i]),
+            int(used),
+            remaining,
+            int(on_max_capacity) - int(allocated),
+            hbytes(on_max_capacity - allocated),
+            hbytes(used),
+            int(allocated),
+        )
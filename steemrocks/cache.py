@@ -0,0 +1,213 @@
+import json
+import logging
+import threading
+import time
+from functools import wraps
+
+import redis
+from flask import request
+from jinja2 import Markup
+
+from . import metrics, pubsub, settings
+from .tracing import render_template
+from .utils import get_redis_conn, history_filters, history_filters_query
+
+logger = logging.getLogger('steemrocks')
+
+_cache_backend = None
+_version_subscriber = None
+
+# account versions read in this process, kept while the subscriber is
+# connected and dropped when the account is invalidated.
+_versions = {}
+MAX_VERSIONS = 100000
+
+
+class LocalBackend(object):
+    """In-process fallback for when redis is not reachable. Entries are
+    only visible to the current process."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at < time.time():
+                del self.entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self._evict()
+            self.entries[key] = (value, expires_at)
+
+    def incr(self, key):
+        with self.lock:
+            value, expires_at = self.entries.get(key, (0, None))
+            self.entries[key] = (int(value) + 1, expires_at)
+            return value + 1
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (_, expires_at) in self.entries.items()
+                    if expires_at and expires_at < now]:
+            del self.entries[key]
+        # still full, drop the oldest half.
+        if len(self.entries) >= self.max_entries:
+            for key in list(self.entries)[:self.max_entries // 2]:
+                del self.entries[key]
+
+
+class RedisBackend(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, key):
+        value = self.conn.get(key)
+        if value is not None:
+            return value.decode("utf-8")
+
+    def set(self, key, value, ttl=None):
+        self.conn.set(key, value, ex=ttl)
+
+    def incr(self, key):
+        return self.conn.incr(key)
+
+
+def get_cache():
+    global _cache_backend
+    if not _cache_backend:
+        try:
+            conn = get_redis_conn()
+            conn.ping()
+            _cache_backend = RedisBackend(conn)
+        except redis.exceptions.ConnectionError:
+            logger.warning(
+                'Redis is not reachable. Using in-process response cache.')
+            _cache_backend = LocalBackend()
+    return _cache_backend
+
+
+def account_version(username):
+    if _version_subscriber and _version_subscriber.connected.is_set():
+        version = _versions.get(username)
+        if version is None:
+            version = get_cache().get("cache-version:%s" % username) or 0
+            if len(_versions) >= MAX_VERSIONS:
+                _versions.clear()
+            _versions[username] = version
+        return version
+    return get_cache().get("cache-version:%s" % username) or 0
+
+
+def forget_versions(message):
+    for account in message["accounts"]:
+        _versions.pop(account, None)
+
+
+def subscribe_invalidations():
+    """Keeps account versions in memory, instead of reading them from
+    redis on every lookup, as long as the invalidations arrive."""
+    global _version_subscriber
+    if _version_subscriber or not isinstance(get_cache(), RedisBackend):
+        return
+    _version_subscriber = pubsub.Subscriber(
+        [pubsub.INVALIDATIONS_CHANNEL], forget_versions,
+        on_disconnect=_versions.clear)
+    _version_subscriber.start()
+
+
+def invalidate_account(username):
+    """Bumps the account's version, so every page and fragment key built
+    with the old version is never read again and expires with its TTL."""
+    invalidate_accounts([username])
+
+
+def invalidate_accounts(usernames):
+    """Bumps the versions and publishes the accounts, so the processes
+    keeping versions in memory drop them."""
+    usernames = sorted(set(username for username in usernames if username))
+    if not usernames:
+        return
+    backend = get_cache()
+    if not isinstance(backend, RedisBackend):
+        for username in usernames:
+            backend.incr("cache-version:%s" % username)
+        return
+    pipe = backend.conn.pipeline(transaction=False)
+    for username in usernames:
+        pipe.incr("cache-version:%s" % username)
+    pipe.publish(pubsub.INVALIDATIONS_CHANNEL,
+                 pubsub.dumps({"accounts": usernames}))
+    pipe.execute()
+
+
+def get_account_data(username):
+    account_data = get_cache().get("account:%s:%s" % (
+        username, account_version(username)))
+    metrics.record_cache("account", account_data is not None)
+    if account_data:
+        return json.loads(account_data)
+
+
+def set_account_data(username, account_data):
+    get_cache().set(
+        "account:%s:%s" % (username, account_version(username)),
+        json.dumps(account_data),
+        settings.ACCOUNT_CACHE_TTL)
+
+
+def page_key(endpoint, username, page=None, filters=None, cursor=None):
+    return "page:%s:%s:%s:%s:%s:%s" % (
+        endpoint, username, account_version(username), page, filters,
+        cursor)
+
+
+def cached_page(ttl=None):
+    """Caches the rendered output of an account page per
+    (route, username, page, history filters, history cursor)."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(username, **kwargs):
+            key = page_key(
+                request.endpoint,
+                username.replace("@", ""),
+                page=kwargs.get("page"),
+                filters=history_filters_query(history_filters(request.args)),
+                cursor=request.args.get("cursor"))
+
+            backend = get_cache()
+            response = backend.get(key)
+            metrics.record_cache("page", response is not None)
+            if response is not None:
+                return response
+
+            response = f(username, **kwargs)
+            if isinstance(response, str):
+                backend.set(key, response, ttl or settings.PAGE_CACHE_TTL)
+            return response
+        return decorated
+    return decorator
+
+
+def left_menu(account):
+    """Renders the sidebar once per account version."""
+    key = "fragment:left_menu:%s:%s" % (
+        account.username, account_version(account.username))
+    backend = get_cache()
+    fragment = backend.get(key)
+    metrics.record_cache("fragment", fragment is not None)
+    if fragment is None:
+        fragment = render_template("left_menu.html", account=account)
+        backend.set(key, fragment, settings.FRAGMENT_CACHE_TTL)
+    return Markup(fragment)
@@ -0,0 +1,250 @@
+"""
+Runs the transaction listener on several hosts at once.
+
+Listener processes coordinate through three MySQL tables:
+
+    listener_leader      a single row, the process holding the leadership
+                         until expires_at.
+    block_leases         block ranges. pending ranges are leased by one
+                         worker at a time and marked done once persisted.
+    listener_checkpoint  the last block below which every block is done.
+
+Every process is a worker. The leader also advances the checkpoint over
+the contiguous done ranges, puts expired leases back to pending and adds
+new ranges up to the target block.
+
+    $ flask listen_cluster
+"""
+import logging
+import os
+import socket
+import time
+from concurrent.futures import wait
+
+from . import metrics, state, settings
+from .tx_listener import TransactionListener
+from .utils import get_db, get_steem_conn
+
+logger = logging.getLogger('steemrocks')
+
+
+class Coordinator(object):
+
+    def __init__(self, listener, worker_id=None):
+        self.listener = listener
+        self.worker_id = worker_id or "%s:%s" % (
+            socket.gethostname(), os.getpid())
+        self.db = get_db(new=True)
+
+    def execute(self, query, args=None):
+        cursor = self.db.cursor()
+        try:
+            affected = cursor.execute(query, args)
+            rows = cursor.fetchall()
+            self.db.commit()
+        finally:
+            cursor.close()
+        return affected, rows
+
+    def elect(self):
+        """Takes or renews the leadership. Returns True if this process is
+        the leader."""
+        # worker is assigned first, so expires_at only moves if the row
+        # belongs to this worker after the update.
+        self.execute(
+            "INSERT INTO listener_leader (id, worker, expires_at) "
+            "VALUES (1, %s, NOW() + INTERVAL %s SECOND) "
+            "ON DUPLICATE KEY UPDATE "
+            "worker = IF(worker = VALUES(worker) OR expires_at < NOW(), "
+            "VALUES(worker), worker), "
+            "expires_at = IF(worker = VALUES(worker), "
+            "VALUES(expires_at), expires_at)",
+            (self.worker_id, settings.LEADER_LEASE_SECONDS))
+        _, rows = self.execute(
+            "SELECT worker FROM listener_leader WHERE id = 1")
+        return rows[0]["worker"] == self.worker_id
+
+    def load_checkpoint(self, fallback_block_num):
+        _, rows = self.execute(
+            "SELECT block_num FROM listener_checkpoint WHERE id = 1")
+        if rows:
+            return rows[0]["block_num"]
+        # the first run continues from the single listener checkpoint.
+        block_num = state.load_checkpoint(
+            fallback_block_num=fallback_block_num)
+        self.execute(
+            "INSERT IGNORE INTO listener_checkpoint (id, block_num) "
+            "VALUES (1, %s)", (block_num, ))
+        return block_num
+
+    def advance_checkpoint(self, checkpoint):
+        _, rows = self.execute(
+            "SELECT start_block, end_block FROM block_leases "
+            "WHERE status = 'done' AND start_block > %s "
+            "ORDER BY start_block", (checkpoint, ))
+        new_checkpoint = checkpoint
+        for row in rows:
+            if row["start_block"] != new_checkpoint + 1:
+                break
+            new_checkpoint = row["end_block"]
+
+        if new_checkpoint != checkpoint:
+            self.execute(
+                "UPDATE listener_checkpoint SET block_num = %s WHERE id = 1",
+                (new_checkpoint, ))
+            self.execute(
+                "DELETE FROM block_leases "
+                "WHERE status = 'done' AND end_block <= %s",
+                (new_checkpoint, ))
+        return new_checkpoint
+
+    def lead(self):
+        props = self.listener.properties
+        target_block = self.listener.target_block_num(props)
+        state.dump_state(props)
+        checkpoint = self.advance_checkpoint(
+            self.load_checkpoint(target_block))
+        metrics.BLOCK_LAG.set(props['head_block_number'] - checkpoint)
+
+        affected, _ = self.execute(
+            "UPDATE block_leases SET status = 'pending', worker = NULL "
+            "WHERE status = 'leased' AND expires_at < NOW()")
+        if affected:
+            logger.warning('Released %s expired leases.', affected)
+
+        _, rows = self.execute(
+            "SELECT COUNT(*) AS ranges, MAX(end_block) AS last_block "
+            "FROM block_leases")
+        open_ranges = rows[0]["ranges"]
+        last_block = max(rows[0]["last_block"] or 0, checkpoint)
+        new_ranges = []
+        while last_block < target_block and \
+                open_ranges + len(new_ranges) < settings.MAX_LEASED_RANGES:
+            end_block = min(
+                last_block + settings.LEASE_RANGE_SIZE, target_block)
+            new_ranges.append((last_block + 1, end_block))
+            last_block = end_block
+
+        if new_ranges:
+            cursor = self.db.cursor()
+            cursor.executemany(
+                "INSERT IGNORE INTO block_leases "
+                "(start_block, end_block, status) "
+                "VALUES (%s, %s, 'pending')", new_ranges)
+            self.db.commit()
+            logger.info('Added %s ranges up to block %s.',
+                        len(new_ranges), last_block)
+
+        # after the ranges are added, so workers don't wait for it.
+        self.listener.refresh_richlist()
+
+    def lease(self):
+        """Returns the (start_block, end_block) leased to this worker."""
+        affected, _ = self.execute(
+            "UPDATE block_leases SET status = 'leased', worker = %s, "
+            "expires_at = NOW() + INTERVAL %s SECOND "
+            "WHERE status = 'pending' ORDER BY start_block LIMIT 1",
+            (self.worker_id, settings.LEASE_SECONDS))
+        if not affected:
+            return None
+        _, rows = self.execute(
+            "SELECT start_block, end_block FROM block_leases "
+            "WHERE status = 'leased' AND worker = %s "
+            "ORDER BY start_block LIMIT 1", (self.worker_id, ))
+        if rows:
+            return rows[0]["start_block"], rows[0]["end_block"]
+
+    def renew(self, start_block):
+        """Extends the lease. Returns False if it was lost."""
+        self.execute(
+            "UPDATE block_leases SET expires_at = NOW() + INTERVAL %s SECOND "
+            "WHERE start_block = %s AND worker = %s AND status = 'leased'",
+            (settings.LEASE_SECONDS, start_block, self.worker_id))
+        # the affected row count is 0 when expires_at didn't change.
+        _, rows = self.execute(
+            "SELECT worker, status FROM block_leases WHERE start_block = %s",
+            (start_block, ))
+        return bool(rows) and rows[0]["worker"] == self.worker_id and \
+            rows[0]["status"] == 'leased'
+
+    def finish(self, start_block, done):
+        if done:
+            self.execute(
+                "UPDATE block_leases SET status = 'done' "
+                "WHERE start_block = %s AND worker = %s",
+                (start_block, self.worker_id))
+        else:
+            self.execute(
+                "UPDATE block_leases SET status = 'pending', worker = NULL "
+                "WHERE start_block = %s AND worker = %s",
+                (start_block, self.worker_id))
+
+    def process_range(self, start_block, end_block):
+        """Persists the blocks of a leased range. Returns False if the
+        range couldn't be completed and should be leased again."""
+        logger.info('Processing blocks %s-%s.', start_block, end_block)
+        futures = []
+        renewed_at = time.time()
+        for block_num in range(start_block, end_block + 1):
+            if time.time() - renewed_at > settings.LEASE_SECONDS / 3:
+                renewed_at = time.time()
+                if not self.renew(start_block):
+                    logger.warning('Lost the lease of %s-%s.',
+                                   start_block, end_block)
+                    return False
+            block_data = self.listener.get_block(block_num)
+            if not block_data:
+                logger.warning('Couldnt read the block: %s.', block_num)
+                return False
+            if 'transactions' in block_data:
+                futures.append(self.listener.thread_pool.submit(
+                    self.listener.persist_block, block_data, block_num))
+
+        # the blocks are persisted in the background, the lease is renewed
+        # while waiting for them too.
+        pending = set(futures)
+        while pending:
+            timeout = max(
+                settings.LEASE_SECONDS / 3 - (time.time() - renewed_at), 0)
+            done, pending = wait(pending, timeout=timeout)
+            for future in done:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.exception(e)
+                    return False
+            if pending:
+                renewed_at = time.time()
+                if not self.renew(start_block):
+                    logger.warning('Lost the lease of %s-%s.',
+                                   start_block, end_block)
+                    return False
+        return True
+
+    def run(self):
+        logger.info('Starting listener worker %s', self.worker_id)
+        while True:
+            if self.elect():
+                self.lead()
+
+            lease = self.lease()
+            if not lease:
+                time.sleep(self.listener.seconds_until_next_block(
+                    self.listener.properties))
+                continue
+
+            start_block, end_block = lease
+            self.finish(start_block, self.process_range(start_block, end_block))
+
+
+def listen_cluster():
+    if settings.ARCHIVE_PATH:
+        # every host would write a partial archive, and the archive's
+        # intern tables are not safe to share between processes.
+        raise RuntimeError(
+            'ARCHIVE_PATH is not supported by listen_cluster. Unset it, '
+            'and archive with a single listen_transactions process.')
+    if settings.LISTENER_METRICS_PORT:
+        metrics.start_metrics_server(settings.LISTENER_METRICS_PORT)
+    listener = TransactionListener(get_steem_conn())
+    Coordinator(listener).run()
@@ -0,0 +1,54 @@
+"""
+Tables derived from stored operations.
+
+A stage is a pair of functions. `extract(operation)` takes a
+models.Operation and returns a list of rows, it must not touch the
+database so `flask reindex` can run it in worker processes.
+`write(db_conn, rows)` bulk-writes the rows of many operations. The
+listener runs every stage on each block it persists, and `flask reindex`
+runs them over the whole history. `tables` are the tables the stage
+writes to, with a block_num column. The garbage collector deletes their
+rows together with the operations.
+"""
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger('steemrocks')
+
+stages = OrderedDict()
+
+
+def register(name, extract, write, tables=()):
+    stages[name] = (extract, write, tables)
+
+
+def extract_rows(operations):
+    rows = {}
+    for name, (extract, _, _) in stages.items():
+        rows[name] = []
+        for operation in operations:
+            rows[name].extend(extract(operation))
+    return rows
+
+
+def write_rows(db_conn, rows):
+    """Writes the rows of each stage. A failing stage is logged and skipped,
+    the rows of the other stages are still written."""
+    for name, stage_rows in rows.items():
+        if not stage_rows:
+            continue
+        try:
+            stages[name][1](db_conn, stage_rows)
+        except Exception:
+            logger.exception('Couldnt write the %s rows.', name)
+
+
+def delete_blocks(db_conn, start_block, end_block):
+    """Deletes the rows of the blocks in [start_block, end_block) from the
+    stage tables."""
+    cursor = db_conn.cursor()
+    for _, _, tables in stages.values():
+        for table in tables:
+            cursor.execute(
+                "DELETE FROM %s WHERE block_num >= %%s AND block_num < %%s"
+                % table, (start_block, end_block))
@@ -1,25 +1,42 @@
 import logging
 
+from . import derived
+from . import permlinks  # noqa: F401, registers the permlinks stage
+from . import transfers  # noqa: F401, registers the transfers stage
 from .utils import get_db
 
 logger = logging.getLogger('steemrocks')
 logger.setLevel(logging.INFO)
 logging.basicConfig()
 
+# the newest operations are kept.
+KEEP_OPERATIONS = 100000
+# blocks deleted per transaction.
+BLOCKS_PER_DELETE = 1000
+
 
 def gc():
+    """Deletes the operations older than the newest KEEP_OPERATIONS, with
+    the rows the derived stages made out of them, a block range at a
+    time."""
     db = get_db()
     cursor = db.cursor()
-    query = "SELECT MIN(id) AS minimum_id FROM operations"
-    cursor.execute(query)
-    min_id = cursor.fetchone()["minimum_id"]
-
-    query = "SELECT MAX(id) AS maximum_id FROM operations"
-    cursor.execute(query)
-    max_id = cursor.fetchone()["maximum_id"]
+    cursor.execute(
+        "SELECT block_num FROM operations ORDER BY block_num DESC "
+        "LIMIT 1 OFFSET %s", (KEEP_OPERATIONS, ))
+    row = cursor.fetchone()
+    if not row:
+        return
+    cutoff_block = row["block_num"]
 
-    to = max_id - 100000
-    for i in range(min_id, to):
-        cursor.execute("DELETE FROM operations WHERE id = %s", i)
+    cursor.execute("SELECT MIN(block_num) AS minimum FROM operations")
+    start_block = cursor.fetchone()["minimum"]
+    while start_block < cutoff_block:
+        end_block = min(start_block + BLOCKS_PER_DELETE, cutoff_block)
+        derived.delete_blocks(db, start_block, end_block)
+        cursor.execute(
+            "DELETE FROM operations WHERE block_num >= %s AND block_num < %s",
+            (start_block, end_block))
         db.commit()
-        print("deleted", i)
+        logger.info('Deleted blocks %s-%s.', start_block, end_block - 1)
+        start_block = end_block
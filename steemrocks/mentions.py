@@ -0,0 +1,138 @@
+"""
+Extracts `@username` mentions out of comment bodies and stores them as
+`mention` operations next to the comment they were found in.
+
+Extraction is a regex pass and runs wherever the derived stages run
+(listener thread pool, reindex workers). Candidates are checked against
+the known accounts set when written. Names that were never seen are looked
+up in accounts_dict, then verified with get_accounts calls of
+ACCOUNT_BATCH_SIZE names, through the client of the listener or the
+reindexer (known_accounts.steem).
+"""
+import json
+import logging
+import re
+import threading
+
+from . import cache, derived, rpc, settings
+from .accounts_dict import accounts_dict
+from .utils import get_steem_conn
+
+logger = logging.getLogger('steemrocks')
+
+# steem account names: 3-16 chars, lowercase letters, digits, dashes and
+# dots. the lookbehind skips emails and urls like steemit.com/@user.
+MENTION_PATTERN = re.compile(r"(?<![\w@/.-])@([a-z][a-z0-9.-]{1,14}[a-z0-9])")
+
+MAX_MENTIONS_PER_COMMENT = 20
+MAX_UNKNOWN_NAMES = 100000
+
+INSERT_MENTIONS = "INSERT IGNORE INTO operations " \
+    "(`block_num`, `trx_in_block`, `op_in_trx`, `virtual_op`, `sub_op`, " \
+    "`tx_id`, `type`, `raw_data`, `actor`, `effected`, `created_at`, " \
+    "`actor_id`, `effected_id`) VALUES " \
+    "(%s, %s, %s, %s, %s, %s, 'mention', %s, %s, %s, %s, %s, %s)"
+
+
+class KnownAccounts(object):
+    """Interned set of account names known to exist, plus a bounded set of
+    names known not to exist."""
+
+    def __init__(self):
+        self.names = set()
+        self.unknown = set()
+        self.lock = threading.Lock()
+        self.steem = None
+
+    def add(self, *usernames):
+        for username in usernames:
+            if username:
+                self.names.add(username)
+
+    def filter(self, db_conn, candidates):
+        candidates = set(candidates)
+        to_verify = candidates - self.names - self.unknown
+        if to_verify:
+            # every interned name was the actor or effected of an operation.
+            interned = accounts_dict.get_ids(db_conn, to_verify, create=False)
+            self.add(*interned)
+            to_verify -= set(interned)
+        if to_verify:
+            self.verify(to_verify)
+        return candidates & self.names
+
+    def verify(self, usernames):
+        steem = self.steem or get_steem_conn()
+        usernames = sorted(usernames)
+        existing = set()
+        try:
+            for i in range(0, len(usernames), settings.ACCOUNT_BATCH_SIZE):
+                existing.update(
+                    account["name"] for account in steem.get_accounts(
+                        usernames[i:i + settings.ACCOUNT_BATCH_SIZE])
+                    if account)
+        except rpc.RPCError as e:
+            # the names are skipped for this block, not marked unknown, so
+            # they are verified again the next time they are mentioned.
+            logger.warning('Couldnt verify mentioned accounts: %s', e)
+            with self.lock:
+                self.names.update(existing)
+            return
+        with self.lock:
+            self.names.update(existing)
+            if len(self.unknown) > MAX_UNKNOWN_NAMES:
+                self.unknown.clear()
+            self.unknown.update(set(usernames) - existing)
+
+
+known_accounts = KnownAccounts()
+
+
+def find_mentions(body):
+    mentions = []
+    for username in MENTION_PATTERN.findall(body):
+        if username not in mentions:
+            mentions.append(username)
+        if len(mentions) == MAX_MENTIONS_PER_COMMENT:
+            break
+    return mentions
+
+
+def extract(operation):
+    if operation.type != "comment":
+        return []
+    comment = operation.sub_operation
+    if not comment or not comment.body or comment.is_an_edit:
+        return []
+
+    rows = []
+    for sub_op, username in enumerate(find_mentions(comment.body), 1):
+        if username == comment.author:
+            continue
+        rows.append((
+            operation.block_num, operation.trx_in_block, operation.op_in_trx,
+            operation.virtual_op, sub_op, operation.tx_id,
+            json.dumps({"author": comment.author,
+                        "permlink": comment.permlink,
+                        "effected": username}),
+            comment.author, username, operation.created_at))
+    return rows
+
+
+def write(db_conn, rows):
+    known_accounts.add(*[row[7] for row in rows])
+    existing = known_accounts.filter(db_conn, (row[8] for row in rows))
+    rows = [row for row in rows if row[8] in existing]
+    if not rows:
+        return
+
+    account_ids = accounts_dict.get_ids(
+        db_conn, set(row[7] for row in rows) | set(row[8] for row in rows))
+    cursor = db_conn.cursor()
+    cursor.executemany(INSERT_MENTIONS, [
+        row + (account_ids.get(row[7]), account_ids.get(row[8]))
+        for row in rows])
+    cache.invalidate_accounts(row[8] for row in rows)
+
+
+derived.register("mentions", extract, write)
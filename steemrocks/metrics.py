@@ -0,0 +1,130 @@
+import os
+import time
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST,
+    REGISTRY, generate_latest, multiprocess, start_http_server
+)
+
+# set by multi-process servers (gunicorn with several workers), every
+# process writes its samples there and /metrics aggregates them.
+MULTIPROC_DIR = os.environ.get("prometheus_multiproc_dir") or \
+    os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+BLOCK_LAG = Gauge(
+    'steemrocks_block_lag',
+    'Blocks between the head block and the last processed block.')
+
+BLOCKS_INGESTED = Counter(
+    'steemrocks_blocks_ingested_total',
+    'Blocks persisted by the listener.')
+
+OPERATIONS_INGESTED = Counter(
+    'steemrocks_operations_ingested_total',
+    'Operations persisted by the listener.')
+
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    'steemrocks_executor_queue_depth',
+    'Blocks waiting in the listener thread pool.')
+
+RPC_LATENCY = Histogram(
+    'steemrocks_rpc_latency_seconds',
+    'Latency of calls to the steem nodes.',
+    ['method'])
+
+ESTIMATOR_LATENCY = Histogram(
+    'steemrocks_estimator_latency_seconds',
+    'Latency of the reward estimator calls.',
+    ['endpoint'])
+
+RPC_ERRORS = Counter(
+    'steemrocks_rpc_errors_total',
+    'Failed calls to the steem nodes.',
+    ['method'])
+
+RPC_NODE_ERRORS = Counter(
+    'steemrocks_rpc_node_errors_total',
+    'Failed calls per steem node.',
+    ['node'])
+
+RPC_HEDGED = Counter(
+    'steemrocks_rpc_hedged_total',
+    'Reads sent to a second node because the first one was slow.',
+    ['method'])
+
+DB_WRITE_LATENCY = Histogram(
+    'steemrocks_db_write_latency_seconds',
+    'Latency of database writes.',
+    ['table'])
+
+REQUEST_LATENCY = Histogram(
+    'steemrocks_request_latency_seconds',
+    'Latency of web requests.',
+    ['endpoint'])
+
+CACHE_REQUESTS = Counter(
+    'steemrocks_cache_requests_total',
+    'Response cache lookups.',
+    ['kind', 'result'])
+
+
+def record_cache(kind, hit):
+    CACHE_REQUESTS.labels(kind, "hit" if hit else "miss").inc()
+
+
+class InstrumentedSteem(object):
+    """Wraps a steem client and records the latency and failures of every
+    call made through it."""
+
+    def __init__(self, steem):
+        self.steem = steem
+
+    def __getattr__(self, name):
+        attr = getattr(self.steem, name)
+        if not callable(attr):
+            return attr
+
+        def instrumented(*args, **kwargs):
+            start = time.time()
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                RPC_ERRORS.labels(name).inc()
+                raise
+            finally:
+                RPC_LATENCY.labels(name).observe(time.time() - start)
+        return instrumented
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.request_started_at = time.time()
+
+    @app.after_request
+    def record_request_latency(response):
+        if hasattr(g, 'request_started_at'):
+            REQUEST_LATENCY.labels(request.endpoint).observe(
+                time.time() - g.request_started_at)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        registry = REGISTRY
+        if MULTIPROC_DIR:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+        return generate_latest(registry), 200, \
+            {'Content-Type': CONTENT_TYPE_LATEST}
+
+
+def child_exit(server, worker):
+    """gunicorn hook, drops the live gauges of exited workers."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid, path=MULTIPROC_DIR)
+
+
+def start_metrics_server(port):
+    start_http_server(port)
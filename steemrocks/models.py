@@ -2,20 +2,31 @@ import json
 import logging
 import math
 import time
-import uuid
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
 
 from dateutil.parser import parse
 from steem.amount import Amount
 
-from . import state
+from . import cache, metrics, settings, state, voting
+from .accounts_dict import accounts_dict
+from .bandwidth import BandwidthBatch
 from .settings import INTERFACE_LINK, SITE_URL
-from .utils import get_db, get_steem_conn, hbytes
+from .utils import get_db
 
 logger = logging.getLogger('steemrocks')
 logger.setLevel(logging.DEBUG)
 logging.basicConfig()
 
+# primary key of the operations, their position on the chain.
+OPERATION_KEY = 'block_num, trx_in_block, op_in_trx, virtual_op, sub_op'
+# position of an operation in the account history.
+HISTORY_POSITION = 'created_at, %s' % OPERATION_KEY
+# account history order, newest first.
+HISTORY_ORDER = ', '.join(
+    '%s DESC' % column for column in HISTORY_POSITION.split(', '))
+HISTORY_ORDER_ASC = HISTORY_ORDER.replace(' DESC', ' ASC')
+
 
 class Block(object):
     def __init__(self, db_conn, block_num, block_data):
@@ -44,6 +55,7 @@ class Block(object):
 
         self.db_conn.commit()
         end = time.time()
+        metrics.DB_WRITE_LATENCY.labels("blocks").observe(end - start)
         logger.info('Persisting to database took %s seconds.', end - start)
 
 
@@ -54,10 +66,13 @@ class Transaction(object):
         self.block_num = block_num
         self.raw_data = '{}'
 
+        # virtual operations have no transaction. they are grouped under
+        # one deterministic id per block, so replays map to the same row.
         if self.id == "0000000000000000000000000000000000000000":
-            self.id = "vop-%s" % str(uuid.uuid4())
+            self.id = "vop-%s" % block_num
 
     def persist(self):
+        start = time.time()
         cursor = self.db_conn.cursor()
         dumped_raw_data = json.dumps(self.raw_data)
 
@@ -68,12 +83,25 @@ class Transaction(object):
         cursor.execute(query, [
             self.id, self.block_num, dumped_raw_data])
         self.db_conn.commit()
+        metrics.DB_WRITE_LATENCY.labels("transactions").observe(
+            time.time() - start)
 
 
 class Operation(object):
     def __init__(self, db_conn, tx_id, op_type, op_data, created_at,
-                 actor=None, effected=None, account=None):
+                 actor=None, effected=None, account=None, op_id=None,
+                 block_num=None, trx_in_block=0, op_in_trx=0, virtual_op=0,
+                 sub_op=0):
         self.db_conn = db_conn
+        self.id = op_id
+        # (block_num, trx_in_block, op_in_trx, virtual_op) identifies an
+        # operation on the chain. sub_op numbers the operations derived
+        # from it (mentions), together they are the primary key.
+        self.block_num = block_num
+        self.trx_in_block = trx_in_block
+        self.op_in_trx = op_in_trx
+        self.virtual_op = virtual_op
+        self.sub_op = sub_op
         self.tx_id = tx_id
         self.raw_data = op_data
         self.type = op_type
@@ -89,6 +117,12 @@ class Operation(object):
     def sub_operation(self):
         return self.get_concrete_operation()
 
+    @property
+    def position(self):
+        """Position in the account history, see HISTORY_POSITION."""
+        return (self.created_at, self.block_num, self.trx_in_block,
+                self.op_in_trx, self.virtual_op, self.sub_op)
+
     @property
     def trx_id(self):
         if self.tx_id.startswith("vop"):
@@ -190,16 +224,25 @@ class Operation(object):
             actor = concrete_operation.actor
             effected = concrete_operation.effected
 
+        start = time.time()
+        account_ids = accounts_dict.get_ids(self.db_conn, [actor, effected])
         cursor = self.db_conn.cursor()
         dumped_raw_data = json.dumps(self.raw_data)
-        query = "INSERT INTO operations " \
-                "(`tx_id`, `type`, `raw_data`, `actor`, `effected`, " \
-                "`created_at`) VALUES " \
-                "(%s, %s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE raw_data=%s"
+        query = "INSERT IGNORE INTO operations " \
+                "(`block_num`, `trx_in_block`, `op_in_trx`, `virtual_op`, " \
+                "`sub_op`, `tx_id`, `type`, `raw_data`, `actor`, " \
+                "`effected`, `actor_id`, `effected_id`, `created_at`) " \
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
         cursor.execute(query, [
-            self.tx_id, self.type, dumped_raw_data, actor, effected,
-            self.created_at, dumped_raw_data])
+            self.block_num, self.trx_in_block, self.op_in_trx,
+            self.virtual_op, self.sub_op, self.tx_id, self.type,
+            dumped_raw_data, actor, effected, account_ids.get(actor),
+            account_ids.get(effected), self.created_at])
+        # 0 if the operation was already stored.
+        self.id = cursor.lastrowid or self.id
         self.db_conn.commit()
+        metrics.DB_WRITE_LATENCY.labels("operations").observe(
+            time.time() - start)
 
 
 class Vote(object):
@@ -218,6 +261,10 @@ class Vote(object):
     def effected(self):
         return self.author
 
+    @property
+    def post(self):
+        return self.author, self.permlink
+
     @property
     def link(self):
         return "%s/@%s/%s" % (INTERFACE_LINK, self.author, self.permlink)
@@ -266,6 +313,15 @@ class Comment(object):
     def effected(self):
         return self.parent_author
 
+    @property
+    def post(self):
+        return self.author, self.permlink
+
+    @property
+    def parent_post(self):
+        if self.parent_author and self.parent_permlink:
+            return self.parent_author, self.parent_permlink
+
     @property
     def parent_link(self):
         if self.parent_permlink and self.parent_author:
@@ -351,9 +407,13 @@ class Transfer(object):
         self.amount = raw_data.get("amount")
         self.account = account
 
+    @property
+    def is_private_memo(self):
+        return bool(self.memo) and self.memo.startswith("#")
+
     @property
     def public_memo(self):
-        if self.memo.startswith("#"):
+        if self.is_private_memo:
             return "Private memo. Contents are hidden."
         return self.memo
 
@@ -433,21 +493,122 @@ class Follow(object):
         )
 
 
+class AccountMetrics(object):
+    """Derived numbers of an account. Computed in a single pass over the
+    account data against one chain state snapshot."""
+
+    def __init__(self, account_data, global_data):
+        self.global_data = global_data
+        self.steem_per_mvests = (
+            Amount(global_data["total_vesting_fund_steem"]).amount /
+            (Amount(global_data["total_vesting_shares"]).amount / 1e6)
+        )
+
+        self.vesting_shares = Amount(account_data["vesting_shares"]).amount
+        self.delegated_vesting_shares = Amount(
+            account_data["delegated_vesting_shares"]).amount
+        self.received_vesting_shares = Amount(
+            account_data["received_vesting_shares"]).amount
+
+        self.sp = round(self.vests_to_sp(self.vesting_shares), 2)
+        self.delegated_sp = round(
+            self.vests_to_sp(self.delegated_vesting_shares), 2)
+        self.received_sp = round(
+            self.vests_to_sp(self.received_vesting_shares), 2)
+        self.total_sp = round(
+            self.sp + self.received_sp - self.delegated_sp, 2)
+
+        self.balances = {
+            'STEEM': "%.3f" % Amount(account_data['balance']).amount,
+            'SBD': "%.3f" % Amount(account_data['sbd_balance']).amount,
+            'VESTS': "%.3f" % self.vesting_shares,
+        }
+
+        now = datetime.utcnow()
+        self.voting_power = self.get_voting_power(account_data, now)
+        self.reputation = self.get_reputation(account_data)
+        self.bandwidth = self.get_bandwidth(account_data, now)
+        self.creation_date = parse(account_data['created']).date()
+
+    def vests_to_sp(self, vests):
+        return vests / 1e6 * self.steem_per_mvests
+
+    @staticmethod
+    def get_voting_power(account_data, now):
+        return "%.2f" % voting.voting_power(
+            [account_data["voting_power"]],
+            [account_data["last_vote_time"]], now=now)[0]
+
+    @staticmethod
+    def get_reputation(account_data, precision=2):
+        rep = int(account_data['reputation'])
+        if rep == 0:
+            return 25
+        score = max([math.log10(abs(rep)) - 9, 0]) * 9 + 25
+        if rep < 0:
+            score = 50 - score
+        return round(score, precision)
+
+    def get_bandwidth(self, account_data, now):
+        return BandwidthBatch.from_accounts(
+            [account_data], self.global_data, now=now).tuple(0)
+
+
 class Account:
     def __init__(self, username, steem, db_conn=None):
         self.username = username
         self.steem = steem
         self.account_data = None
         self.json_metadata = None
+        self.metrics = None
         self.db_conn = db_conn or get_db()
-        self._bandwidth = None
+        self._account_id = None
 
     def set_account_deta(self):
-        self.account_data = self.steem.get_account(self.username)
-        if self.account_data and self.account_data.get("json_metadata"):
-            self.json_metadata = json.loads(self.account_data['json_metadata'])
+        account_data = cache.get_account_data(self.username)
+        if not account_data:
+            account_data = self.steem.get_account(self.username)
+            if account_data:
+                cache.set_account_data(self.username, account_data)
+        return self.load(account_data, state.load_state())
+
+    def load(self, account_data, global_data):
+        self.account_data = account_data
+        if self.account_data:
+            if self.account_data.get("json_metadata"):
+                self.json_metadata = json.loads(
+                    self.account_data['json_metadata'])
+            self.metrics = AccountMetrics(self.account_data, global_data)
         return self
 
+    @classmethod
+    def load_many(cls, usernames, steem, db_conn=None, chunk_size=None):
+        """Loads accounts with one get_accounts call per chunk instead of
+        one get_account call per user. Unknown usernames are skipped."""
+        chunk_size = chunk_size or settings.ACCOUNT_BATCH_SIZE
+        usernames = list(OrderedDict.fromkeys(usernames))
+        account_data = {}
+        missing = []
+        for username in usernames:
+            cached = cache.get_account_data(username)
+            if cached:
+                account_data[username] = cached
+            else:
+                missing.append(username)
+
+        for i in range(0, len(missing), chunk_size):
+            for data in steem.get_accounts(missing[i:i + chunk_size]):
+                if not data:
+                    continue
+                account_data[data["name"]] = data
+                cache.set_account_data(data["name"], data)
+
+        global_data = state.load_state()
+        db_conn = db_conn or get_db()
+        return [cls(username, steem, db_conn=db_conn).load(
+                    account_data[username], global_data)
+                for username in usernames if username in account_data]
+
     @property
     def profile(self):
         if self.json_metadata and 'profile' in self.json_metadata:
@@ -479,186 +640,167 @@ class Account:
 
     @property
     def balances(self):
-        steem_balance = "%.3f" % Amount(self.account_data['balance']).amount
-        sbd_balance = "%.3f" % Amount(self.account_data['sbd_balance']).amount
-        vests = "%.3f" % Amount(self.account_data['vesting_shares']).amount
-
-        return {
-            'STEEM': steem_balance,
-            'SBD': sbd_balance,
-            'VESTS': vests,
-        }
+        return self.metrics.balances
 
     @property
     def voting_power(self):
-        last_vote_time = parse(self.account_data["last_vote_time"])
-        diff_in_seconds = (datetime.utcnow() - last_vote_time).total_seconds()
-        regenerated_vp = diff_in_seconds * 10000 / 86400 / 5
-        total_vp = (self.account_data["voting_power"] +
-                    regenerated_vp) / 100
-        if total_vp > 100:
-            total_vp = 100
-
-        return "%.2f" % total_vp
+        return self.metrics.voting_power
 
     @property
-    def reputation(self, precision=2):
-        rep = int(self.account_data['reputation'])
-        if rep == 0:
-            return 25
-        score = max([math.log10(abs(rep)) - 9, 0]) * 9 + 25
-        if rep < 0:
-            score = 50 - score
-        return round(score, precision)
+    def reputation(self):
+        return self.metrics.reputation
 
     @property
     def bandwidth(self):
-        if self._bandwidth:
-            return self._bandwidth
-
-        global_data = state.load_state()
-        received_vesting_shares = Amount(
-            self.account_data["received_vesting_shares"]).amount
-        vesting_shares = Amount(
-            self.account_data["vesting_shares"]).amount
-        max_virtual_bandwidth = float(global_data["max_virtual_bandwidth"])
-        total_vesting_shares = Amount(
-            global_data["total_vesting_shares"]).amount
-
-        delegated_vesting_shares = Amount(
-            self.account_data["delegated_vesting_shares"]
-        ).amount
-
-        allocated_bandwidth = (max_virtual_bandwidth * (
-            vesting_shares + received_vesting_shares - delegated_vesting_shares
-        ) / total_vesting_shares)
-
-        total_seconds = 604800
-        bw_updated = parse(self.account_data["last_bandwidth_update"])
-        diff = (datetime.utcnow() - bw_updated).total_seconds()
-        average_bandwidth = float(
-            self.account_data["average_bandwidth"])
-
-        used_bandwidth = 0
-        if diff < total_seconds:
-            used_bandwidth = (((total_seconds - diff) *
-                               average_bandwidth) / total_seconds)
-
-        used_bandwidth = used_bandwidth / 1000000
-        allocated_bandwidth = allocated_bandwidth / 1000000
-        used_bandwidth_percent = 100 * used_bandwidth / allocated_bandwidth
-        free_bandwidth_percent = round(
-            (100 - used_bandwidth_percent), 2)
-
-        current_reserve_ratio = global_data["current_reserve_ratio"]
-        max_reserve_ratio = 200000000
-
-        bandwidth_on_max_capacity = allocated_bandwidth * \
-            (max_reserve_ratio / current_reserve_ratio)
-
-        left_bw = int(allocated_bandwidth - used_bandwidth)
-        if left_bw < 0:
-            left_bw = 0
-
-        self._bandwidth = (
-            hbytes(left_bw),
-            hbytes(allocated_bandwidth),
-            hbytes(allocated_bandwidth - left_bw),
-            free_bandwidth_percent,
-            int(used_bandwidth),
-            left_bw,
-            int(bandwidth_on_max_capacity) - int(allocated_bandwidth),
-            hbytes(bandwidth_on_max_capacity - allocated_bandwidth),
-            hbytes(used_bandwidth),
-            int(allocated_bandwidth),
-        )
-
-        return self._bandwidth
+        return self.metrics.bandwidth
 
     @property
     def sp(self):
-        vests = Amount(self.account_data['vesting_shares']).amount
-        return round(self.vests_to_sp(vests), 2)
+        return self.metrics.sp
 
     @property
     def delegated_sp(self):
-        vests = Amount(self.account_data['delegated_vesting_shares']).amount
-        return round(self.vests_to_sp(vests), 2)
+        return self.metrics.delegated_sp
 
     @property
     def received_sp(self):
-        vests = Amount(self.account_data['received_vesting_shares']).amount
-        return round(self.vests_to_sp(vests), 2)
+        return self.metrics.received_sp
 
     @property
     def total_sp(self):
-        return round(self.sp + self.received_sp - self.delegated_sp, 2)
+        return self.metrics.total_sp
 
     @property
     def worth_sp(self):
-        s = get_steem_conn()
-        info = state.load_state()
-        p = 10000
-        sp = self.total_sp  # steem power
-        vp = 100  # voting power
-        vw = 100  # voting weight
-        tvf = Amount(info['total_vesting_fund_steem']).amount
-        tvs = Amount(info['total_vesting_shares']).amount
-        r = float(sp / (tvf / tvs))
-        m = float(100 * vp * (100 * vw) / p)
-        m = float((m + 49) / 50)
-        quote = Amount(s.get_current_median_history_price()['quote']).amount
-        base = Amount(s.get_current_median_history_price()['base']).amount
-        o = base / quote
-        rb = Amount(s.get_reward_fund('post')['reward_balance']).amount
-        rc = float(s.get_reward_fund('post')['recent_claims'])
-        i = rb / rc
-        return "%.4f" % (r * m * 100 * i * o)
+        """Value of a full vote at 100% voting power."""
+        vests = self.total_sp / self.steem_per_mvests() * 1e6
+        return "%.4f" % voting.vote_value(
+            [vests], voting.get_vote_inputs(self.steem))[0]
 
     @property
     def creation_date(self):
-        return parse(self.account_data['created']).date()
+        return self.metrics.creation_date
 
     def vests_to_sp(self, vests):
-        return vests / 1e6 * self.steem_per_mvests()
+        return self.metrics.vests_to_sp(vests)
 
     def steem_per_mvests(self):
-        info = state.load_state()
-        return (
-            Amount(info["total_vesting_fund_steem"]).amount /
-            (Amount(info["total_vesting_shares"]).amount / 1e6)
-        )
+        return self.metrics.steem_per_mvests
+
+    @property
+    def account_id(self):
+        """Interned id of the username, 0 if it has no operations."""
+        if self._account_id is None:
+            self._account_id = accounts_dict.get_id(
+                self.db_conn, self.username, create=False) or 0
+        return self._account_id
+
+    def _history_branches(self, filters, columns, limit=None, before=None,
+                          after=None):
+        """One SELECT per (direction, type) of the filters, UNION ALL'ed.
+        Each one is a range scan of an (account, type, created_at) or
+        (account, created_at) index, so no branch reads rows outside of
+        the filters. before and after are positions, only older (newest
+        first) or newer (oldest first) operations are selected."""
+        direction = filters.get("direction", "any")
+        account_columns = {
+            "actor": ["actor_id"],
+            "effected": ["effected_id"],
+        }.get(direction, ["actor_id", "effected_id"])
+
+        branches, params = [], []
+        for account_column in account_columns:
+            for op_type in filters.get("op_types") or [None]:
+                where = ['%s=%%s' % account_column]
+                params.append(self.account_id)
+                if account_column == "effected_id" and direction == "any":
+                    # already in the actor branch.
+                    where.append('NOT (actor_id <=> %s)')
+                    params.append(self.account_id)
+                if op_type:
+                    where.append('type=%s')
+                    params.append(op_type)
+                if filters.get("start_date"):
+                    where.append('created_at >= %s')
+                    params.append(filters["start_date"])
+                if filters.get("end_date"):
+                    where.append('created_at < %s')
+                    params.append(
+                        filters["end_date"] + timedelta(days=1))
+                for position, operator in [(before, '<'), (after, '>')]:
+                    if not position:
+                        continue
+                    # the first condition is the range of the index scan.
+                    where.append('created_at %s= %%s and (%s) %s (%s)' % (
+                        operator, HISTORY_POSITION, operator,
+                        ', '.join(['%s'] * len(position))))
+                    params.append(position[0])
+                    params.extend(position)
+                branch = 'SELECT %s FROM operations where %s' % (
+                    columns, ' and '.join(where))
+                if limit:
+                    # the primary key breaks the created_at ties, so the
+                    # pages are stable within a block.
+                    branch += ' ORDER BY %s LIMIT %d' % (
+                        HISTORY_ORDER_ASC if after else HISTORY_ORDER,
+                        limit)
+                branches.append('(%s)' % branch)
+        return ' UNION ALL '.join(branches), params
+
+    def count_operations(self, filters):
+        """Number of operations matching the history filters, counted up
+        to MAX_COUNTED_OPERATIONS."""
+        branches, params = self._history_branches(
+            filters, '1', limit=settings.MAX_COUNTED_OPERATIONS)
+        cursor = self.db_conn.cursor()
+        cursor.execute(
+            'SELECT COUNT(*) as total FROM (%s) h' % branches, params)
+        return min(cursor.fetchone()["total"],
+                   settings.MAX_COUNTED_OPERATIONS)
+
+    def search_operations(self, filters, offset=0, limit=30, before=None):
+        """Operations matching the history filters, newest first. The
+        page is cut out of the index entries, only its rows are read."""
+        branches, params = self._history_branches(
+            filters, '%s, created_at' % OPERATION_KEY, limit=offset + limit,
+            before=before)
+        query = 'SELECT o.* FROM (SELECT * FROM (%s) u ' \
+                'ORDER BY %s LIMIT %%s, %%s) h ' \
+                'JOIN operations o USING (%s) ORDER BY %s' % (
+                    branches, HISTORY_ORDER, OPERATION_KEY,
+                    HISTORY_ORDER.replace('created_at', 'h.created_at'))
+        cursor = self.db_conn.cursor()
+        cursor.execute(query, params + [offset, limit])
+        return self._to_operations(cursor)
 
     def get_operation_count(self, op_type=None):
-        cursor = self.db_conn.cursor()
-        if not op_type:
-            query = 'SELECT COUNT(*) as total FROM operations where ' \
-                    'actor=%s or effected=%s'
-            cursor.execute(query, (self.username, self.username))
-        else:
-            query = 'SELECT COUNT(*) as total FROM operations where ' \
-                    '(actor=%s or effected=%s) and type=%s'
-            cursor.execute(query, (self.username, self.username, op_type))
-        return cursor.fetchone()["total"]
+        return self.count_operations(
+            {"op_types": [op_type] if op_type else []})
 
     def get_operations(self, start=0, end=0, op_type=None):
-        if not op_type:
-            query = 'SELECT * FROM operations where ' \
-                    '(actor=%s or effected=%s) ORDER BY created_at ' \
-                    'DESC LIMIT %s, %s'
-            cursor = self.db_conn.cursor()
-            cursor.execute(
-                query, (self.username, self.username, start, end)
-            )
-        else:
-            query = 'SELECT * FROM operations where ' \
-                    '(actor=%s or effected=%s) and type=%s ' \
-                    'ORDER BY created_at DESC LIMIT %s, %s'
-            cursor = self.db_conn.cursor()
-            cursor.execute(
-                query, (self.username, self.username, op_type, start, end)
-            )
+        return self.search_operations(
+            {"op_types": [op_type] if op_type else []},
+            offset=start, limit=end)
+
+    def get_operations_before(self, before=None, limit=30, op_type=None):
+        """Keyset paginated version of get_operations. Pass the position
+        of the last operation of the previous page as before."""
+        return self.search_operations(
+            {"op_types": [op_type] if op_type else []},
+            limit=limit, before=before)
+
+    def get_operations_by_id(self, op_ids):
+        """Operations of the account with the given ids, oldest first."""
+        if not op_ids:
+            return []
+        query = 'SELECT * FROM operations where id IN (%s) and ' \
+                '(actor_id=%%s or effected_id=%%s) ORDER BY id' % (
+                    ", ".join(["%s"] * len(op_ids)))
+        cursor = self.db_conn.cursor()
+        cursor.execute(query, list(op_ids) + [self.account_id] * 2)
+        return self._to_operations(cursor)
 
+    def _to_operations(self, cursor):
         operations = []
         for op in cursor:
             operations.append(Operation(
@@ -669,11 +811,50 @@ class Account:
                 op["created_at"],
                 actor=op["actor"],
                 effected=op["effected"],
-                account=self.username
+                account=self.username,
+                op_id=op["id"],
+                block_num=op["block_num"],
+                trx_in_block=op["trx_in_block"],
+                op_in_trx=op["op_in_trx"],
+                virtual_op=op["virtual_op"],
+                sub_op=op["sub_op"],
             ))
 
         return operations
 
+    def iter_operations(self, op_type=None):
+        """Yields every stored operation row of the account, oldest
+        first. Rows are read EXPORT_CHUNK_SIZE at a time with keyset
+        pagination over the history branches, so memory use does not grow
+        with the history size and nothing sorts the whole history."""
+        filters = {"op_types": [op_type] if op_type else []}
+        chunk_size = settings.EXPORT_CHUNK_SIZE
+        db_conn = get_db(new=True)
+        cursor = db_conn.cursor()
+        try:
+            after = None
+            while True:
+                branches, params = self._history_branches(
+                    filters, '%s, created_at' % OPERATION_KEY,
+                    limit=chunk_size, after=after)
+                cursor.execute(
+                    'SELECT o.* FROM (SELECT * FROM (%s) u '
+                    'ORDER BY %s LIMIT %d) h '
+                    'JOIN operations o USING (%s) ORDER BY %s' % (
+                        branches, HISTORY_ORDER_ASC, chunk_size,
+                        OPERATION_KEY, HISTORY_ORDER_ASC.replace(
+                            'created_at', 'h.created_at')), params)
+                rows = cursor.fetchall()
+                for op in rows:
+                    yield op
+                if len(rows) < chunk_size:
+                    break
+                after = tuple(rows[-1][column]
+                              for column in HISTORY_POSITION.split(', '))
+        finally:
+            cursor.close()
+            db_conn.close()
+
     @property
     def user_link(self):
         return "%s/@%s" % (INTERFACE_LINK, self.username)
@@ -759,6 +940,10 @@ class Resteem:
     def effected(self):
         return self.raw_data.get("author")
 
+    @property
+    def post(self):
+        return self.raw_data.get("author"), self.raw_data.get("permlink")
+
     @property
     def action(self):
         actor_url = SITE_URL + '/' + self.actor
@@ -812,6 +997,10 @@ class AuthorReward:
     def effected(self):
         return ""
 
+    @property
+    def post(self):
+        return self.raw_data["author"], self.raw_data["permlink"]
+
     @property
     def link(self):
         return "%s/@%s/%s" % (
@@ -1002,6 +1191,11 @@ class CurationReward:
     def effected(self):
         return ""
 
+    @property
+    def post(self):
+        return (self.raw_data["comment_author"],
+                self.raw_data["comment_permlink"])
+
     @property
     def link(self):
         return "%s/@%s/%s" % (
@@ -0,0 +1,78 @@
+"""
+Index of the operations about a post, keyed by @author/permlink.
+
+Votes, comments, resteems and the author and curation rewards carry the
+post they are about in their raw data. The permlinks stage copies
+(author, permlink) out of them into `post_operations`, whose primary key
+starts with the post, so the activity of one post is a single range read
+joined back to `operations` by the chain position. Replies are indexed
+under their own permlink and under their parent's.
+"""
+from . import derived
+from .accounts_dict import accounts_dict
+from .models import Operation
+
+KEY = "block_num, trx_in_block, op_in_trx, virtual_op, sub_op"
+
+INSERT_POST_OPERATIONS = "INSERT IGNORE INTO post_operations " \
+    "(`author_id`, `permlink`, `block_num`, `trx_in_block`, `op_in_trx`, " \
+    "`virtual_op`, `sub_op`, `type`, `created_at`) VALUES " \
+    "(%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+
+def extract(operation):
+    concrete_operation = operation.sub_operation
+    posts = [getattr(concrete_operation, "post", None),
+             getattr(concrete_operation, "parent_post", None)]
+
+    rows = []
+    for post in posts:
+        if not post or not post[0] or not post[1]:
+            continue
+        rows.append(post + (
+            operation.block_num, operation.trx_in_block, operation.op_in_trx,
+            operation.virtual_op, operation.sub_op, operation.type,
+            operation.created_at))
+    return rows
+
+
+def write(db_conn, rows):
+    account_ids = accounts_dict.get_ids(db_conn, set(row[0] for row in rows))
+    cursor = db_conn.cursor()
+    cursor.executemany(INSERT_POST_OPERATIONS, [
+        (account_ids.get(row[0]), ) + row[1:] for row in rows
+        if account_ids.get(row[0])])
+
+
+derived.register("permlinks", extract, write, tables=["post_operations"])
+
+
+def count_post_operations(db_conn, author, permlink):
+    author_id = accounts_dict.get_id(db_conn, author, create=False)
+    if not author_id:
+        return 0
+    cursor = db_conn.cursor()
+    cursor.execute(
+        "SELECT COUNT(*) AS total FROM post_operations "
+        "WHERE author_id = %s AND permlink = %s", (author_id, permlink))
+    return cursor.fetchone()["total"]
+
+
+def get_post_operations(db_conn, author, permlink, offset=0, limit=30):
+    """Operations about the post, newest first."""
+    author_id = accounts_dict.get_id(db_conn, author, create=False)
+    if not author_id:
+        return []
+    order = ", ".join("%s DESC" % column for column in KEY.split(", "))
+    cursor = db_conn.cursor()
+    cursor.execute(
+        "SELECT o.* FROM (SELECT %s FROM post_operations "
+        "WHERE author_id = %%s AND permlink = %%s "
+        "ORDER BY %s LIMIT %%s, %%s) p "
+        "JOIN operations o USING (%s) ORDER BY %s" % (
+            KEY, order, KEY, order),
+        (author_id, permlink, offset, limit))
+    return [Operation(
+        db_conn, op["tx_id"], op["type"], op["raw_data"], op["created_at"],
+        actor=op["actor"], effected=op["effected"], op_id=op["id"])
+        for op in cursor]
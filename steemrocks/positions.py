@@ -0,0 +1,95 @@
+"""
+Backfills the chain positions of the operations stored before the
+(block_num, trx_in_block, op_in_trx, virtual_op) primary key existed.
+
+Those rows are flagged with legacy_position. Each of their blocks is read
+again with get_ops_in_block, and every legacy row is moved to the
+position of the matching chain operation (same type and data). If the
+block was replayed since and the position is already taken, the legacy
+row is a duplicate and is deleted.
+
+    $ flask backfill_positions
+"""
+import json
+import logging
+
+import pymysql
+
+from .utils import get_db
+
+logger = logging.getLogger('steemrocks')
+
+BLOCKS_PER_QUERY = 1000
+
+
+def legacy_blocks(db):
+    last_block = -1
+    cursor = db.cursor()
+    while True:
+        cursor.execute(
+            "SELECT DISTINCT block_num FROM operations "
+            "WHERE legacy_position = 1 AND block_num > %s "
+            "ORDER BY block_num LIMIT %s", (last_block, BLOCKS_PER_QUERY))
+        blocks = [row["block_num"] for row in cursor.fetchall()]
+        if not blocks:
+            break
+        for block_num in blocks:
+            yield block_num
+        last_block = blocks[-1]
+
+
+def backfill_block(db, steem, block_num):
+    """Returns the number of (moved, deleted) rows."""
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT id, type, raw_data FROM operations "
+        "WHERE block_num = %s AND legacy_position = 1 ORDER BY id",
+        (block_num, ))
+    rows = cursor.fetchall()
+
+    chain_ops = [
+        (operation["op"][0], operation["op"][1], operation["trx_in_block"],
+         operation["op_in_trx"], operation["virtual_op"])
+        for operation in steem.get_ops_in_block(
+            block_num, virtual_only=False)]
+
+    moved, deleted = 0, 0
+    for row in rows:
+        raw_data = json.loads(row["raw_data"])
+        match = next((chain_op for chain_op in chain_ops
+                      if chain_op[0] == row["type"] and
+                      chain_op[1] == raw_data), None)
+        if not match:
+            logger.warning('No chain operation for %s in block %s.',
+                           row["id"], block_num)
+            continue
+        chain_ops.remove(match)
+        try:
+            cursor.execute(
+                "UPDATE operations SET trx_in_block = %s, op_in_trx = %s, "
+                "virtual_op = %s, legacy_position = 0 WHERE id = %s",
+                match[2:] + (row["id"], ))
+            moved += 1
+        except pymysql.err.IntegrityError:
+            # the block was replayed, the operation is already stored.
+            cursor.execute(
+                "DELETE FROM operations WHERE id = %s", (row["id"], ))
+            deleted += 1
+    db.commit()
+    return moved, deleted
+
+
+def backfill_positions(steem):
+    db = get_db(new=True)
+    moved, deleted = 0, 0
+    try:
+        for block_num in legacy_blocks(db):
+            block_moved, block_deleted = backfill_block(db, steem, block_num)
+            moved += block_moved
+            deleted += block_deleted
+            logger.info('Block %s: moved %s, deleted %s duplicates.',
+                        block_num, block_moved, block_deleted)
+    finally:
+        db.close()
+    logger.info('Backfilled %s positions, deleted %s duplicates.',
+                moved, deleted)
@@ -0,0 +1,153 @@
+"""
+Fan-out of newly ingested operations over redis pub/sub.
+
+Once a block is committed, the listener publishes a message to
+BLOCKS_CHANNEL and one to the channel of every account in the block:
+
+    {"b": <block_num>, "ops": [[<account>, <op type>, <op id>], ...]}
+
+The per account messages only carry that account's operations. Operations
+are listed once for their actor and once for their effected account.
+
+Cache invalidations are published to INVALIDATIONS_CHANNEL, by the
+listener and by every other writer (mentions, reindex):
+
+    {"accounts": [<account>, ...]}
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+import redis
+
+from .utils import get_redis_conn
+
+logger = logging.getLogger('steemrocks')
+
+BLOCKS_CHANNEL = "steemrocks:blocks"
+INVALIDATIONS_CHANNEL = "steemrocks:invalidations"
+
+
+def account_channel(username):
+    return "steemrocks:account:%s" % username
+
+
+def block_message(block_num, operations):
+    """Returns the message of the whole block and the ones per account."""
+    ops = []
+    per_account = {}
+    for operation in operations:
+        concrete_operation = operation.sub_operation
+        accounts = [concrete_operation.actor]
+        if concrete_operation.effected != concrete_operation.actor:
+            accounts.append(concrete_operation.effected)
+        for account in accounts:
+            if not account:
+                continue
+            op = [account, operation.type, operation.id]
+            ops.append(op)
+            per_account.setdefault(account, []).append(op)
+    return {"b": block_num, "ops": ops}, dict(
+        (account, {"b": block_num, "ops": account_ops})
+        for account, account_ops in per_account.items())
+
+
+def dumps(message):
+    return json.dumps(message, separators=(",", ":"))
+
+
+def publish_block(block_num, operations):
+    message, account_messages = block_message(block_num, operations)
+    if not message["ops"]:
+        return
+    try:
+        pipe = get_redis_conn().pipeline(transaction=False)
+        pipe.publish(BLOCKS_CHANNEL, dumps(message))
+        for account, account_message in account_messages.items():
+            pipe.publish(account_channel(account), dumps(account_message))
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        # subscribers are best effort, the block is already persisted.
+        logger.warning('Couldnt publish block %s: %s', block_num, e)
+
+
+class AccountStreams(object):
+    """Hands the operations in the blocks channel to the open streams of
+    their accounts, so a web process needs a single redis connection for
+    all of its streams."""
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.subscriber = None
+
+    def start(self):
+        with self.lock:
+            if not self.subscriber:
+                self.subscriber = Subscriber(
+                    [BLOCKS_CHANNEL], self.dispatch)
+                self.subscriber.start()
+
+    def open(self, username):
+        ops = queue.Queue(maxsize=self.max_pending)
+        with self.lock:
+            self.queues.setdefault(username, set()).add(ops)
+        return ops
+
+    def close(self, username, ops):
+        with self.lock:
+            streams = self.queues.get(username, set())
+            streams.discard(ops)
+            if not streams:
+                self.queues.pop(username, None)
+
+    def dispatch(self, message):
+        per_account = {}
+        for op in message["ops"]:
+            per_account.setdefault(op[0], []).append(op)
+        for account, account_ops in per_account.items():
+            with self.lock:
+                streams = list(self.queues.get(account, ()))
+            for ops in streams:
+                try:
+                    ops.put_nowait(account_ops)
+                except queue.Full:
+                    # the client is not reading, it will reconnect and
+                    # see the missed operations on the profile page.
+                    pass
+
+
+account_streams = AccountStreams()
+
+
+class Subscriber(threading.Thread):
+    """Calls on_message with every decoded message of the channels, and
+    reconnects when redis goes away. `connected` is only set while
+    messages can be received."""
+
+    def __init__(self, channels, on_message, on_disconnect=None):
+        super(Subscriber, self).__init__(daemon=True)
+        self.channels = channels
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.connected = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                pubsub = get_redis_conn().pubsub(
+                    ignore_subscribe_messages=True)
+                pubsub.subscribe(*self.channels)
+                self.connected.set()
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.on_message(json.loads(message["data"]))
+            except redis.exceptions.RedisError as e:
+                logger.warning('Subscriber disconnected: %s', e)
+            self.connected.clear()
+            if self.on_disconnect:
+                self.on_disconnect()
+            time.sleep(1)
@@ -0,0 +1,176 @@
+"""
+Recomputes the columns and tables derived from stored operations.
+
+Operations are read in primary key order, either from the database or
+from the binary archive, in chunks. A process pool maps every chunk
+through the concrete operation classes and the derived table stages, and
+the results are bulk-written back. The position of the last written
+chunk is checkpointed, so an interrupted run continues where it stopped.
+
+    $ flask reindex --source db --chunk-size 10000 --workers 8
+"""
+import json
+import logging
+import multiprocessing
+import time
+from collections import deque
+
+from . import archive, cache, derived, settings, state
+from . import mentions
+from . import permlinks  # noqa: F401, registers the permlinks stage
+from . import transfers  # noqa: F401, registers the transfers stage
+from .accounts_dict import accounts_dict
+from .models import Operation
+from .utils import get_db, get_steem_conn
+
+logger = logging.getLogger('steemrocks')
+
+# block_num, trx_in_block, op_in_trx, virtual_op, sub_op, tx_id, type,
+# raw_data, created_at
+SELECT_CHUNK = "SELECT block_num, trx_in_block, op_in_trx, virtual_op, " \
+               "sub_op, tx_id, type, raw_data, created_at FROM operations " \
+               "WHERE (block_num, trx_in_block, op_in_trx, virtual_op, " \
+               "sub_op) > (%s, %s, %s, %s, %s) " \
+               "ORDER BY block_num, trx_in_block, op_in_trx, virtual_op, " \
+               "sub_op LIMIT %s"
+
+UPSERT_OPERATIONS = "INSERT INTO operations " \
+    "(`block_num`, `trx_in_block`, `op_in_trx`, `virtual_op`, `sub_op`, " \
+    "`tx_id`, `type`, `raw_data`, `actor`, `effected`, `created_at`, " \
+    "`actor_id`, `effected_id`) " \
+    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) " \
+    "ON DUPLICATE KEY UPDATE " \
+    "actor=VALUES(actor), effected=VALUES(effected), " \
+    "actor_id=VALUES(actor_id), effected_id=VALUES(effected_id)"
+
+
+def iter_db_chunks(chunk_size, position=None):
+    """Yields (position, rows) where position is the primary key of the
+    last row in the chunk."""
+    db = get_db(new=True)
+    position = position or [-1, 0, 0, 0, 0]
+    while True:
+        cursor = db.cursor()
+        cursor.execute(SELECT_CHUNK, list(position) + [chunk_size])
+        rows = [(r["block_num"], r["trx_in_block"], r["op_in_trx"],
+                 r["virtual_op"], r["sub_op"], r["tx_id"], r["type"],
+                 r["raw_data"], r["created_at"]) for r in cursor]
+        cursor.close()
+        if not rows:
+            break
+        position = list(rows[-1][:5])
+        yield position, rows
+    db.close()
+
+
+def iter_archive_chunks(chunk_size, position=None):
+    """Yields (position, rows) where position is the last block in the
+    chunk. Chunks always end on a block boundary."""
+    reader = archive.ArchiveReader(settings.ARCHIVE_PATH)
+    start_block = position + 1 if position is not None else 0
+    rows = []
+    for block_num, operations in reader.iter_blocks(start_block=start_block):
+        for op in operations:
+            rows.append((
+                op.block_num, op.trx_in_block, op.op_in_trx, op.virtual_op,
+                0, op.tx_id, op.type, json.dumps(op.raw_data),
+                op.created_at))
+        if len(rows) >= chunk_size:
+            yield block_num, rows
+            rows = []
+    if rows:
+        yield block_num, rows
+
+
+def derive_chunk(rows):
+    """Runs in the worker processes."""
+    operation_rows = []
+    operations = []
+    for (block_num, trx_in_block, op_in_trx, virtual_op, sub_op, tx_id,
+         op_type, raw_data, created_at) in rows:
+        operation = Operation(
+            None, tx_id, op_type, raw_data, created_at,
+            block_num=block_num, trx_in_block=trx_in_block,
+            op_in_trx=op_in_trx, virtual_op=virtual_op, sub_op=sub_op)
+        try:
+            concrete_operation = operation.get_concrete_operation()
+        except Exception as e:
+            logger.error('Skipping %s: %s', (block_num, trx_in_block,
+                                             op_in_trx, virtual_op,
+                                             sub_op), e)
+            continue
+        if not concrete_operation:
+            continue
+
+        operations.append(operation)
+        operation_rows.append((
+            block_num, trx_in_block, op_in_trx, virtual_op, sub_op, tx_id,
+            op_type, raw_data, concrete_operation.actor,
+            concrete_operation.effected, created_at))
+
+    return operation_rows, derived.extract_rows(operations)
+
+
+def write_chunk(db, operation_rows, derived_rows):
+    cursor = db.cursor()
+    if operation_rows:
+        account_ids = accounts_dict.get_ids(
+            db, set(row[8] for row in operation_rows) |
+            set(row[9] for row in operation_rows))
+        cursor.executemany(UPSERT_OPERATIONS, [
+            row + (account_ids.get(row[8]), account_ids.get(row[9]))
+            for row in operation_rows])
+    accounts = [row[8] for row in operation_rows] + \
+        [row[9] for row in operation_rows]
+    mentions.known_accounts.add(*accounts)
+    derived.write_rows(db, derived_rows)
+    db.commit()
+    cache.invalidate_accounts(accounts)
+
+
+def reindex(source="db", chunk_size=10000, workers=None, restart=False):
+    checkpoint = None if restart else state.load_reindex_checkpoint()
+    position = None
+    if checkpoint and checkpoint["source"] == source:
+        position = checkpoint["position"]
+        logger.info('Resuming %s reindex from %s', source, position)
+
+    if source == "archive":
+        chunks = iter_archive_chunks(chunk_size, position=position)
+    else:
+        chunks = iter_db_chunks(chunk_size, position=position)
+
+    workers = workers or multiprocessing.cpu_count()
+    mentions.known_accounts.steem = get_steem_conn()
+    db = get_db(new=True)
+    pool = multiprocessing.Pool(workers)
+    in_flight = deque()
+    total = 0
+    start = time.time()
+
+    def drain(until):
+        nonlocal total
+        while len(in_flight) > until:
+            chunk_position, result = in_flight.popleft()
+            operation_rows, derived_rows = result.get()
+            write_chunk(db, operation_rows, derived_rows)
+            state.dump_reindex_checkpoint(
+                {"source": source, "position": chunk_position})
+            total += len(operation_rows)
+            logger.info('Reindexed %s operations, at %s. %.0f ops/s',
+                        total, chunk_position, total / (time.time() - start))
+
+    try:
+        # results are written in submit order, so the checkpoint never
+        # skips over a chunk that is still being processed.
+        for chunk_position, rows in chunks:
+            in_flight.append(
+                (chunk_position, pool.apply_async(derive_chunk, (rows, ))))
+            drain(workers * 2)
+        drain(0)
+    finally:
+        pool.close()
+        pool.join()
+        db.close()
+
+    logger.info('Reindex finished. %s operations.', total)
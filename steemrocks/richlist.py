@@ -0,0 +1,149 @@
+"""
+Rich list and SP leaderboards kept in redis sorted sets.
+
+The listener marks the accounts touched by balance changing operations as
+dirty. refresh_dirty() loads them with batched get_accounts calls and
+updates their scores, so the leaderboards are O(log n) range reads.
+reconcile() refreshes every known account against the node.
+"""
+import logging
+
+import numpy as np
+from steem.amount import Amount
+
+from . import state, settings
+from .utils import get_db, get_redis_conn
+
+logger = logging.getLogger('steemrocks')
+
+DIRTY_KEY = "richlist:dirty"
+
+LEADERBOARDS = ["steem", "sbd", "sp", "delegated_sp", "received_sp",
+                "effective_sp"]
+
+BALANCE_OPERATIONS = set([
+    "transfer", "transfer_to_vesting", "withdraw_vesting",
+    "fill_vesting_withdraw", "claim_reward_balance",
+    "delegate_vesting_shares", "return_vesting_delegation",
+    "author_reward", "curation_reward", "comment_benefactor_reward",
+    "producer_reward", "account_create", "account_create_with_delegation",
+    "transfer_to_savings", "transfer_from_savings",
+    "fill_transfer_from_savings", "limit_order_create", "limit_order_cancel",
+    "fill_order", "convert", "fill_convert_request", "interest",
+    "escrow_transfer", "escrow_approve", "escrow_dispute", "escrow_release",
+])
+
+# fields of the balance operations holding the affected accounts.
+ACCOUNT_FIELDS = ["from", "to", "account", "owner", "delegator",
+                  "delegatee", "author", "curator", "producer", "creator",
+                  "new_account_name", "current_owner", "open_owner",
+                  "from_account", "to_account", "benefactor", "agent",
+                  "receiver"]
+
+
+def leaderboard_key(name):
+    return "richlist:%s" % name
+
+
+def balance_accounts(op_type, op_value):
+    if op_type not in BALANCE_OPERATIONS:
+        return set()
+    return set(op_value[field] for field in ACCOUNT_FIELDS
+               if op_value.get(field))
+
+
+def mark_dirty(usernames):
+    usernames = list(usernames)
+    if usernames:
+        get_redis_conn().sadd(DIRTY_KEY, *usernames)
+
+
+def scores(accounts, global_data):
+    """Leaderboard scores of get_accounts results, one array per
+    leaderboard."""
+    def amounts(key):
+        return np.array([Amount(account[key]).amount for account in accounts],
+                        dtype=float)
+
+    steem_per_vests = (
+        Amount(global_data["total_vesting_fund_steem"]).amount /
+        Amount(global_data["total_vesting_shares"]).amount)
+    sp = amounts("vesting_shares") * steem_per_vests
+    delegated_sp = amounts("delegated_vesting_shares") * steem_per_vests
+    received_sp = amounts("received_vesting_shares") * steem_per_vests
+    return {
+        "steem": amounts("balance"),
+        "sbd": amounts("sbd_balance"),
+        "sp": sp,
+        "delegated_sp": delegated_sp,
+        "received_sp": received_sp,
+        "effective_sp": sp + received_sp - delegated_sp,
+    }
+
+
+def update(steem, usernames):
+    accounts = [account for account in steem.get_accounts(usernames)
+                if account]
+    if not accounts:
+        return 0
+    account_scores = scores(accounts, state.load_state())
+    pipe = get_redis_conn().pipeline(transaction=False)
+    for name in LEADERBOARDS:
+        pairs = []
+        for account, score in zip(accounts, account_scores[name]):
+            pairs.extend([round(float(score), 3), account["name"]])
+        pipe.zadd(leaderboard_key(name), *pairs)
+    pipe.execute()
+    return len(accounts)
+
+
+def refresh_dirty(steem, max_batches=None):
+    """Updates the dirty accounts, ACCOUNT_BATCH_SIZE at a time."""
+    r = get_redis_conn()
+    refreshed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        usernames = r.execute_command(
+            "SPOP", DIRTY_KEY, settings.ACCOUNT_BATCH_SIZE)
+        if not usernames:
+            break
+        usernames = [u.decode("utf-8") for u in usernames]
+        try:
+            refreshed += update(steem, usernames)
+        except Exception:
+            # popped, so put back for the next round.
+            mark_dirty(usernames)
+            raise
+        batches += 1
+    return refreshed
+
+
+def reconcile(steem):
+    """Marks every known account dirty and refreshes them all."""
+    db = get_db(new=True)
+    cursor = db.cursor()
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id, username FROM accounts_dict WHERE id > %s "
+            "ORDER BY id LIMIT %s", (last_id, settings.ACCOUNT_BATCH_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        mark_dirty(row["username"] for row in rows)
+        last_id = rows[-1]["id"]
+    db.close()
+    refreshed = refresh_dirty(steem)
+    logger.info('Reconciled %s accounts.', refreshed)
+
+
+def get_leaderboard(name, start, count):
+    """[(rank, username, score), ...] from the given rank on."""
+    entries = get_redis_conn().zrevrange(
+        leaderboard_key(name), start, start + count - 1, withscores=True)
+    return [(rank, username.decode("utf-8"), score)
+            for rank, (username, score) in enumerate(entries, start + 1)]
+
+
+def leaderboard_size(name):
+    return get_redis_conn().zcard(leaderboard_key(name))
@@ -0,0 +1,204 @@
+"""
+Routes steem RPC calls over the configured nodes.
+
+Every node gets its own client. Latencies and failures of the recent calls
+are kept per node, and each call goes to the fastest healthy node. If the
+node doesn't answer within its p95 latency, the same read is sent to the
+next node and the first answer wins. Hedged calls run on a bounded pool,
+with a single node or a busy pool the call is made on the calling thread.
+Failed calls are retried on the next best node with a bounded exponential
+backoff. The clients don't retry on their own, the first error of a node
+is final.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from steem import Steem
+
+from . import metrics, settings
+
+logger = logging.getLogger('steemrocks')
+
+# methods which change the chain state are never hedged or retried.
+WRITE_METHOD_PREFIXES = ("broadcast", "commit")
+
+
+class RPCError(Exception):
+    pass
+
+
+def disable_client_retries(client, node):
+    """HttpClient.exec retries a failed request on the next node, with a
+    growing sleep, and the next node of a single node client is the same
+    host. Failing the switch ends exec with the first error, so the router
+    is the only retry layer."""
+    def next_node():
+        raise RPCError('%s didnt answer' % node)
+    client.steemd.next_node = next_node
+
+
+def backoff(retry_count):
+    return min(settings.RPC_RETRY_DELAY * 2 ** retry_count,
+               settings.RPC_MAX_RETRY_DELAY)
+
+
+class NodeStats(object):
+    """Rolling latencies and outcomes of the last calls to a node."""
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.last_failure = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.latencies.append(
+                    max(latency, settings.RPC_FAILURE_PENALTY))
+                self.last_failure = time.time()
+
+    def percentile(self, pct):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return 0
+        return latencies[min(len(latencies) - 1,
+                             int(len(latencies) * pct / 100))]
+
+    @property
+    def error_rate(self):
+        with self.lock:
+            if not self.outcomes:
+                return 0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def healthy(self):
+        if self.error_rate <= settings.RPC_MAX_ERROR_RATE:
+            return True
+        # give the node another chance after a while.
+        return time.time() - self.last_failure > settings.RPC_NODE_COOLDOWN
+
+    def hedge_delay(self):
+        if len(self.latencies) < 20:
+            return settings.RPC_HEDGE_DELAY
+        return max(self.percentile(95), settings.RPC_MIN_HEDGE_DELAY)
+
+
+class RPCRouter(object):
+
+    def __init__(self, nodes, client_options=None):
+        self.nodes = list(nodes)
+        self.clients = dict(
+            (node, Steem(nodes=[node], **(client_options or {})))
+            for node in self.nodes)
+        for node, client in self.clients.items():
+            disable_client_retries(client, node)
+        self.stats = dict(
+            (node, NodeStats(settings.RPC_STATS_WINDOW))
+            for node in self.nodes)
+        # every submitted call holds a slot until it completes, so the pool
+        # never queues and a slow call left behind by a hedge can only
+        # disable hedging, not block other calls.
+        self.hedge_pool = ThreadPoolExecutor(
+            max_workers=settings.RPC_HEDGE_POOL_SIZE)
+        self.hedge_slots = threading.BoundedSemaphore(
+            settings.RPC_HEDGE_POOL_SIZE)
+
+    def ranked_nodes(self, exclude=()):
+        """Healthy nodes first, fastest first. The excluded nodes (the
+        ones which already failed the call) are only returned if no other
+        node is left."""
+        nodes = [node for node in self.nodes if node not in exclude]
+        return sorted(nodes or self.nodes, key=lambda node: (
+            not self.stats[node].healthy, self.stats[node].percentile(50)))
+
+    def call_node(self, node, name, args, kwargs):
+        start = time.time()
+        try:
+            result = getattr(self.clients[node], name)(*args, **kwargs)
+        except Exception:
+            self.stats[node].record(time.time() - start, False)
+            metrics.RPC_NODE_ERRORS.labels(node).inc()
+            raise
+        self.stats[node].record(time.time() - start, True)
+        return result
+
+    def call_tracked(self, node, failed, name, args, kwargs):
+        try:
+            return self.call_node(node, name, args, kwargs)
+        except Exception:
+            failed.add(node)
+            raise
+
+    def submit(self, node, failed, name, args, kwargs):
+        """Runs the call on the hedge pool, returns None if no slot is
+        free."""
+        if not self.hedge_slots.acquire(blocking=False):
+            return None
+        future = self.hedge_pool.submit(
+            self.call_tracked, node, failed, name, args, kwargs)
+        future.add_done_callback(lambda _: self.hedge_slots.release())
+        return future
+
+    def call_hedged(self, nodes, failed, name, args, kwargs):
+        future = None
+        if len(nodes) > 1:
+            future = self.submit(nodes[0], failed, name, args, kwargs)
+        if future is None:
+            # nothing to hedge to, or the hedge pool is busy.
+            return self.call_tracked(nodes[0], failed, name, args, kwargs)
+
+        futures = [future]
+        done, _ = wait(futures, timeout=self.stats[nodes[0]].hedge_delay())
+        if not done:
+            hedge = self.submit(nodes[1], failed, name, args, kwargs)
+            if hedge is not None:
+                logger.debug('%s is slow on %s, hedging to %s.',
+                             name, nodes[0], nodes[1])
+                metrics.RPC_HEDGED.labels(name).inc()
+                futures.append(hedge)
+
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, name, *args, **kwargs):
+        if name.startswith(WRITE_METHOD_PREFIXES):
+            return self.call_node(
+                self.ranked_nodes()[0], name, args, kwargs)
+
+        error, failed = None, set()
+        for retry_count in range(settings.RPC_MAX_RETRIES):
+            try:
+                return self.call_hedged(
+                    self.ranked_nodes(exclude=failed), failed,
+                    name, args, kwargs)
+            except Exception as e:
+                error = e
+                if retry_count + 1 < settings.RPC_MAX_RETRIES:
+                    logger.warning('%s failed: %s. Retrying.', name, e)
+                    time.sleep(backoff(retry_count))
+        raise RPCError('%s failed %s times. Last error: %s' % (
+            name, settings.RPC_MAX_RETRIES, error))
+
+    def __getattr__(self, name):
+        attr = getattr(self.clients[self.nodes[0]], name)
+        if not callable(attr):
+            return attr
+
+        def routed(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        return routed
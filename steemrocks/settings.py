@@ -2,4 +2,100 @@ DB_INFO = ('localhost', 'user', 'pass', 'steemexplorer')
 INTERFACE_LINK = "http://steemit.com"
 SITE_URL = "http://steem.rocks"
 
+# seconds
+PAGE_CACHE_TTL = 30
+FRAGMENT_CACHE_TTL = 60
+ACCOUNT_CACHE_TTL = 30
+API_CACHE_TTL = 30
+
+# prometheus metrics of the listener process are served on this port.
+LISTENER_METRICS_PORT = 9102
+
+# per request tracing of sql queries, rpc calls and template rendering.
+# requests exceeding one of the budgets are logged with a breakdown.
+TRACING_ENABLED = False
+TRACE_BUDGET_SECONDS = 1.0
+TRACE_BUDGET_SQL_QUERIES = 20
+TRACE_BUDGET_RPC_CALLS = 5
+# share of traced requests sampled into a flamegraph compatible profile.
+# sync workers only, profiling is disabled in gevent workers.
+TRACE_PROFILE_SAMPLE_RATE = 0.0
+TRACE_PROFILE_INTERVAL = 0.005
+TRACE_PROFILE_DIR = "/tmp/steemrocks-profiles"
+
+# when set, the listener also appends every block to a binary archive
+# in this directory. see archive.py. not supported by listen_cluster.
+ARCHIVE_PATH = None
+
+# rpc calls are routed to the fastest healthy node in NODES. see rpc.py.
+# options passed to the steem client of every node.
+RPC_CLIENT_OPTIONS = {"timeout": 10, "retries": 1}
+RPC_STATS_WINDOW = 200
+RPC_MAX_ERROR_RATE = 0.2
+RPC_NODE_COOLDOWN = 30
+# latency recorded for a failed call, so failing nodes rank as slow.
+RPC_FAILURE_PENALTY = 10
+# a read is sent to a second node if the first one doesn't answer within
+# its p95 latency (RPC_HEDGE_DELAY until there are enough samples).
+RPC_HEDGE_DELAY = 1.0
+RPC_MIN_HEDGE_DELAY = 0.05
+# threads of the hedged calls. when all are busy, calls go to the node
+# directly, without a hedge.
+RPC_HEDGE_POOL_SIZE = 16
+RPC_MAX_RETRIES = 5
+RPC_RETRY_DELAY = 0.25
+RPC_MAX_RETRY_DELAY = 5
+
+# "head" follows the head block, TAIL_BLOCKS_BEHIND_HEAD blocks behind it.
+# "irreversible" only ingests blocks that can not be forked out anymore.
+TAIL_MODE = "head"
+TAIL_BLOCKS_BEHIND_HEAD = 0
+
+# attempts to fetch a block that is not available yet before waiting for
+# the next round.
+BLOCK_FETCH_RETRIES = 3
+
+# flask listen_cluster, see coordinator.py. workers lease ranges of
+# LEASE_RANGE_SIZE blocks, a lease not renewed in LEASE_SECONDS goes back
+# to another worker.
+LEASE_RANGE_SIZE = 100
+LEASE_SECONDS = 60
+LEADER_LEASE_SECONDS = 30
+MAX_LEASED_RANGES = 50
+
+# publish ingested operations to redis channels, see pubsub.py. web
+# processes also subscribe to the cache invalidations to keep account
+# versions in memory.
+PUBSUB_ENABLED = True
+
+# /<username>/stream sends a comment line this often, so proxies don't
+# close idle connections.
+STREAM_HEARTBEAT_SECONDS = 15
+
+# reward fund and median price used for vote values, see voting.py.
+VOTE_INPUTS_CACHE_TTL = 600
+# flask vote_value_ranking ranks the accounts which voted in this many
+# days and keeps the top VOTE_RANKING_SIZE.
+VOTE_RANKING_DAYS = 7
+VOTE_RANKING_SIZE = 1000
+
+# the listener keeps the rich list in redis sorted sets, see richlist.py.
+# accounts changed by balance operations are refreshed between blocks, at
+# most RICHLIST_BATCHES_PER_ROUND get_accounts calls at a time.
+RICHLIST_ENABLED = True
+RICHLIST_BATCHES_PER_ROUND = 2
+RICHLIST_PAGE_SIZE = 100
+
+# filtered account history counts stop at this many operations, the older
+# operations of the profile are paged with a cursor.
+MAX_COUNTED_OPERATIONS = 10000
+# operations read per query by the history exports.
+EXPORT_CHUNK_SIZE = 1000
+
+# username -> id mappings kept in memory by each process.
+ACCOUNTS_DICT_CACHE_SIZE = 100000
+
+# accounts per get_accounts call
+ACCOUNT_BATCH_SIZE = 500
+
 from .local_settings import *
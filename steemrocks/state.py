@@ -5,6 +5,7 @@ import json
 CONFIG_PATH = expanduser('~/.steem_rocks')
 STATE = expanduser("%s/state" % CONFIG_PATH)
 CHECKPOINT = expanduser("%s/checkpoint" % CONFIG_PATH)
+REINDEX_CHECKPOINT = expanduser("%s/reindex" % CONFIG_PATH)
 
 
 def load_state(fallback_data=None):
@@ -39,3 +40,19 @@ def dump_checkpoint(block_num):
     f = open(CHECKPOINT, 'w+')
     f.write(str(block_num))
     f.close()
+
+
+def load_reindex_checkpoint():
+    try:
+        return json.loads(open(REINDEX_CHECKPOINT).read())
+    except FileNotFoundError as e:
+        return None
+
+
+def dump_reindex_checkpoint(data):
+    if not exists(CONFIG_PATH):
+        makedirs(CONFIG_PATH)
+
+    f = open(REINDEX_CHECKPOINT, 'w+')
+    f.write(json.dumps(data))
+    f.close()
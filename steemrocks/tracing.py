@@ -0,0 +1,185 @@
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+import flask
+import pymysql
+from flask import g, has_app_context, request
+
+from . import settings
+
+logger = logging.getLogger('steemrocks')
+
+
+class Trace(object):
+    """Spans recorded while serving a single request."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.spans = []
+
+    def add(self, kind, name, duration):
+        self.spans.append((kind, name, duration))
+
+    def summary(self):
+        calls, durations = Counter(), Counter()
+        for kind, _, duration in self.spans:
+            calls[kind] += 1
+            durations[kind] += duration
+        return calls, durations
+
+    def slowest(self, count=5):
+        return sorted(self.spans, key=lambda s: s[2], reverse=True)[:count]
+
+
+def current_trace():
+    if has_app_context():
+        return getattr(g, 'trace', None)
+
+
+def record(kind, name, duration):
+    trace = current_trace()
+    if trace:
+        trace.add(kind, name, duration)
+
+
+class TracingCursor(pymysql.cursors.DictCursor):
+
+    def execute(self, query, args=None):
+        start = time.time()
+        try:
+            return super(TracingCursor, self).execute(query, args)
+        finally:
+            record("sql", " ".join(query.split())[:120], time.time() - start)
+
+
+class TracedSteem(object):
+
+    def __init__(self, steem):
+        self.steem = steem
+
+    def __getattr__(self, name):
+        attr = getattr(self.steem, name)
+        if not callable(attr):
+            return attr
+
+        def traced(*args, **kwargs):
+            start = time.time()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                record("rpc", name, time.time() - start)
+        return traced
+
+
+def render_template(template_name, **context):
+    start = time.time()
+    try:
+        return flask.render_template(template_name, **context)
+    finally:
+        record("template", template_name, time.time() - start)
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of one thread and keeps the counts in the folded
+    format flamegraph.pl and speedscope read."""
+
+    def __init__(self, thread_id, interval):
+        super(StackSampler, self).__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame:
+                stack.append("%s:%s" % (
+                    frame.f_code.co_filename.split("/")[-1],
+                    frame.f_code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.items():
+                f.write("%s %s\n" % (stack, count))
+
+
+def over_budget(trace, elapsed):
+    calls, _ = trace.summary()
+    return (elapsed > settings.TRACE_BUDGET_SECONDS or
+            calls["sql"] > settings.TRACE_BUDGET_SQL_QUERIES or
+            calls["rpc"] > settings.TRACE_BUDGET_RPC_CALLS)
+
+
+def log_trace(trace, elapsed):
+    calls, durations = trace.summary()
+    breakdown = ", ".join(
+        "%s: %s calls %.1fms" % (kind, calls[kind], durations[kind] * 1000)
+        for kind in ("sql", "rpc", "template"))
+    logger.warning('%s %s took %.1fms over budget. %s',
+                   request.method, request.path, elapsed * 1000, breakdown)
+    for kind, name, duration in trace.slowest():
+        logger.warning('    %.1fms %s %s', duration * 1000, kind, name)
+
+
+def threads_patched():
+    """True in gevent workers. Requests run in greenlets there, which
+    sys._current_frames() doesn't see."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def init_app(app):
+    if not settings.TRACING_ENABLED:
+        return
+
+    profiling = settings.TRACE_PROFILE_SAMPLE_RATE > 0
+    if profiling and threads_patched():
+        logger.warning('Profiling is disabled, it needs a sync worker.')
+        profiling = False
+
+    @app.before_request
+    def start_trace():
+        g.trace = Trace()
+        if profiling and \
+                random.random() < settings.TRACE_PROFILE_SAMPLE_RATE:
+            g.sampler = StackSampler(
+                threading.get_ident(), settings.TRACE_PROFILE_INTERVAL)
+            g.sampler.start()
+
+    @app.after_request
+    def finish_trace(response):
+        trace = current_trace()
+        if trace:
+            elapsed = time.time() - trace.started_at
+            if over_budget(trace, elapsed):
+                log_trace(trace, elapsed)
+        return response
+
+    @app.teardown_request
+    def finish_profile(exception=None):
+        # runs on unhandled exceptions too, so no sampler is left running.
+        sampler = getattr(g, 'sampler', None)
+        if sampler:
+            sampler.stop()
+            if not os.path.exists(settings.TRACE_PROFILE_DIR):
+                os.makedirs(settings.TRACE_PROFILE_DIR)
+            sampler.dump(os.path.join(
+                settings.TRACE_PROFILE_DIR,
+                "%s-%s.folded" % (int(time.time() * 1000), request.endpoint)))
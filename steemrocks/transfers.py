@@ -0,0 +1,140 @@
+"""
+Searchable copy of the transfers.
+
+The transfers stage writes every transfer into the `transfers` table:
+sender and receiver ids, the amount split from its asset, and the memo.
+Private memos (starting with '#') are stored as NULL. Counterparty queries
+are range reads of the (from_id, to_id) and to_id indexes, memo queries go
+through the FULLTEXT index of the memo column.
+
+Results are ordered by chain position, newest first, and paginated with
+a "<block_num>-<trx_in_block>-<op_in_trx>" cursor.
+"""
+import re
+
+from . import derived
+from .accounts_dict import accounts_dict
+
+KEY = ["block_num", "trx_in_block", "op_in_trx"]
+
+MAX_MEMO_TERMS = 10
+
+INSERT_TRANSFERS = "INSERT IGNORE INTO transfers " \
+    "(`block_num`, `trx_in_block`, `op_in_trx`, `from_id`, `to_id`, " \
+    "`amount`, `asset`, `memo`, `created_at`) VALUES " \
+    "(%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+directions = ["any", "in", "out"]
+
+
+def extract(operation):
+    if operation.type != "transfer":
+        return []
+    transfer = operation.sub_operation
+    amount, asset = transfer.amount.split(" ")
+    memo = transfer.memo
+    if not memo or transfer.is_private_memo:
+        memo = None
+    return [(
+        operation.block_num, operation.trx_in_block, operation.op_in_trx,
+        transfer.actor, transfer.effected, amount, asset, memo,
+        operation.created_at)]
+
+
+def write(db_conn, rows):
+    account_ids = accounts_dict.get_ids(
+        db_conn, set(row[3] for row in rows) | set(row[4] for row in rows))
+    cursor = db_conn.cursor()
+    cursor.executemany(INSERT_TRANSFERS, [
+        row[:3] + (account_ids.get(row[3]), account_ids.get(row[4])) +
+        row[5:] for row in rows])
+
+
+derived.register("transfers", extract, write, tables=["transfers"])
+
+
+def memo_phrase(query):
+    """The words of the query as a FULLTEXT phrase, so operators typed in
+    the search box are not interpreted."""
+    terms = re.findall(r"\w+", query or "")[:MAX_MEMO_TERMS]
+    if terms:
+        return '"%s"' % " ".join(terms)
+
+
+def parse_cursor(value):
+    try:
+        position = tuple(int(part) for part in value.split("-"))
+    except (AttributeError, ValueError):
+        return None
+    if len(position) == len(KEY):
+        return position
+
+
+def format_cursor(transfer):
+    return "-".join(str(transfer[column]) for column in KEY)
+
+
+def search_transfers(db_conn, account=None, counterparty=None,
+                     direction="any", memo=None, asset=None, before=None,
+                     limit=30):
+    """Transfers of the account, with the counterparty and/or whose memo
+    contains the memo phrase. Either account or memo is required."""
+    account_id, counterparty_id = None, None
+    if account:
+        account_id = accounts_dict.get_id(db_conn, account, create=False)
+        if not account_id:
+            return []
+    if counterparty:
+        counterparty_id = accounts_dict.get_id(
+            db_conn, counterparty, create=False)
+        if not counterparty_id:
+            return []
+    phrase = memo_phrase(memo)
+    if not account_id and not phrase:
+        return []
+
+    if not account_id:
+        sides = [None]
+    elif direction == "out":
+        sides = [("from_id", "to_id")]
+    elif direction == "in":
+        sides = [("to_id", "from_id")]
+    else:
+        sides = [("from_id", "to_id"), ("to_id", "from_id")]
+
+    order = ", ".join("%s DESC" % column for column in KEY)
+    branches, params = [], []
+    for side in sides:
+        where = []
+        if side:
+            where.append("%s = %%s" % side[0])
+            params.append(account_id)
+            if counterparty_id:
+                where.append("%s = %%s" % side[1])
+                params.append(counterparty_id)
+            if side[0] == "to_id" and len(sides) == 2:
+                # transfers to self are already in the from_id branch.
+                where.append("from_id <> to_id")
+        if phrase:
+            where.append("MATCH (memo) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(phrase)
+        if asset:
+            where.append("asset = %s")
+            params.append(asset)
+        if before:
+            where.append("(%s) < (%%s, %%s, %%s)" % ", ".join(KEY))
+            params.extend(before)
+        branches.append(
+            "(SELECT * FROM transfers WHERE %s ORDER BY %s LIMIT %d)" % (
+                " AND ".join(where), order, limit))
+
+    cursor = db_conn.cursor()
+    cursor.execute(
+        "SELECT t.block_num, t.trx_in_block, t.op_in_trx, "
+        "f.username AS `from`, r.username AS `to`, t.amount, t.asset, "
+        "t.memo, t.created_at FROM (%s) t "
+        "JOIN accounts_dict f ON f.id = t.from_id "
+        "JOIN accounts_dict r ON r.id = t.to_id "
+        "ORDER BY %s LIMIT %d" % (" UNION ALL ".join(branches), order, limit),
+        params)
+    return cursor.fetchall()
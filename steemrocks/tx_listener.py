@@ -1,9 +1,18 @@
+import calendar
 import logging
 import time
 import concurrent
 import multiprocessing
 
-from . import models, state
+import redis
+from dateutil.parser import parse
+
+from . import (
+    archive, cache, derived, mentions, metrics, models, pubsub, richlist,
+    rpc, state, settings
+)
+from . import permlinks  # noqa: F401, registers the permlinks stage
+from . import transfers  # noqa: F401, registers the transfers stage
 from .utils import get_db, get_steem_conn
 
 logger = logging.getLogger('steemrocks')
@@ -15,17 +24,25 @@ class TransactionListener(object):
 
     def __init__(self, steem):
         self.steem = steem
+        mentions.known_accounts.steem = steem
         self.db = get_db()
         self.thread_pool = concurrent.futures.ThreadPoolExecutor(
             max_workers=multiprocessing.cpu_count() + 1)
+        self.archive = None
+        if settings.ARCHIVE_PATH:
+            self.archive = archive.ArchiveWriter(settings.ARCHIVE_PATH)
+        self._block_interval = None
+        self.last_block_id = None
 
     @property
     def properties(self):
-        props = self.steem.get_dynamic_global_properties()
-        if not props:
+        for retry_count in range(settings.RPC_MAX_RETRIES):
+            props = self.steem.get_dynamic_global_properties()
+            if props:
+                return props
             logger.info('Couldnt get block num. Retrying.')
-            return self.properties
-        return props
+            time.sleep(rpc.backoff(retry_count))
+        raise rpc.RPCError('Couldnt get the dynamic global properties.')
 
     @property
     def last_block_num(self):
@@ -33,50 +50,96 @@ class TransactionListener(object):
 
     @property
     def block_interval(self):
-        config = self.steem.get_config()
-        return config["STEEMIT_BLOCK_INTERVAL"]
-
-    def process_block(self, block_num, retry_count=0):
-        block_data = self.steem.get_block(block_num)
-
+        if self._block_interval is None:
+            config = self.steem.get_config()
+            self._block_interval = config["STEEMIT_BLOCK_INTERVAL"]
+        return self._block_interval
+
+    def target_block_num(self, props):
+        """The last block the listener should ingest for now."""
+        if settings.TAIL_MODE == "irreversible":
+            return props['last_irreversible_block_num']
+        return props['head_block_number'] - settings.TAIL_BLOCKS_BEHIND_HEAD
+
+    def seconds_until_next_block(self, props):
+        """Blocks are produced every block_interval seconds after the head
+        block, so wait for the next one instead of a full interval."""
+        head_block_time = calendar.timegm(parse(props['time']).timetuple())
+        wait = head_block_time + self.block_interval - time.time()
+        # a little slack so the node has the block when we ask for it.
+        return min(max(wait + 0.2, 0.2), self.block_interval)
+
+    def get_block(self, block_num):
+        for retry_count in range(settings.BLOCK_FETCH_RETRIES):
+            block_data = self.steem.get_block(block_num)
+            if block_data:
+                return block_data
+            logger.info('Block %s is not available yet.', block_num)
+            time.sleep(min(0.25 * 2 ** retry_count, self.block_interval))
+
+    def process_block(self, block_num, props):
+        """Returns False if the block couldn't be read, so the caller can
+        try it again without moving the checkpoint."""
+        block_data = self.get_block(block_num)
         if not block_data:
-            if retry_count > 3:
-                logger.error(
-                    'Retried 3 times to get this block: %s Skipping.',
-                    block_num
-                )
-                return
+            logger.warning('Couldnt read the block: %s.', block_num)
+            return False
 
-            logger.error(
-                'Couldnt read the block: %s. Retrying.', block_num)
-            self.process_block(block_num, retry_count=retry_count + 1)
+        if self.last_block_id and \
+                block_data.get('previous') != self.last_block_id:
+            logger.warning(
+                'Block %s doesnt follow the last processed block %s, '
+                'the head was reorganized. Operations of the forked out '
+                'block stay in the database.', block_num, self.last_block_id)
+        self.last_block_id = block_data.get('block_id')
 
         logger.info('Processing block: %s', block_num)
         if 'transactions' not in block_data:
-            return
+            return True
 
         self.thread_pool.submit(self.persist_block, block_data, block_num)
-        state.dump_state(self.properties)
+        metrics.EXECUTOR_QUEUE_DEPTH.set(
+            self.thread_pool._work_queue.qsize())
+        state.dump_state(props)
+        return True
 
     def run(self, start_from=None):
         if start_from is None:
             last_block = state.load_checkpoint(
-                fallback_block_num=self.last_block_num,
+                fallback_block_num=self.target_block_num(self.properties),
             )
             logger.info('Last processed block: %s', last_block)
         else:
             last_block = start_from
         while True:
-
-            while (self.last_block_num - last_block) > 0:
+            props = self.properties
+            target_block = self.target_block_num(props)
+            while last_block < target_block:
+                metrics.BLOCK_LAG.set(props['head_block_number'] - last_block)
+                if not self.process_block(last_block + 1, props):
+                    break
                 last_block += 1
-                self.process_block(last_block)
                 state.dump_checkpoint(last_block)
+            metrics.BLOCK_LAG.set(props['head_block_number'] - last_block)
 
-            # Sleep for one block
-            block_interval = self.block_interval
-            logger.info('Sleeping for %s seconds.', block_interval)
-            time.sleep(block_interval)
+            if last_block < target_block:
+                # the block wasn't available yet, ask again soon.
+                continue
+
+            self.refresh_richlist()
+
+            wait = self.seconds_until_next_block(props)
+            logger.debug('Sleeping for %.2f seconds.', wait)
+            time.sleep(wait)
+
+    def refresh_richlist(self):
+        if not settings.RICHLIST_ENABLED:
+            return
+        try:
+            richlist.refresh_dirty(
+                self.steem, max_batches=settings.RICHLIST_BATCHES_PER_ROUND)
+        except (redis.exceptions.RedisError, rpc.RPCError) as e:
+            logger.warning('Couldnt refresh the rich list: %s', e)
 
     def persist_block(self, block_data, block_num):
         db = get_db(new=True)
@@ -84,6 +147,10 @@ class TransactionListener(object):
         block = models.Block(db, block_num, block_data)
         block.persist()
         saved_txs = set()
+        touched_accounts = set()
+        balance_accounts = set()
+        archived_operations = []
+        persisted = []
         operation_data = self.steem.get_ops_in_block(
             block_num, virtual_only=False)
 
@@ -95,18 +162,59 @@ class TransactionListener(object):
                 saved_txs.add(operation["trx_id"])
 
             op_type, op_value = operation['op'][0:2]
+            balance_accounts.update(
+                richlist.balance_accounts(op_type, op_value))
 
             _operation = models.Operation(
                 db, transaction.id,
                 op_type, op_value,
-                block.created_at)
-
-            if _operation.sub_operation:
+                block.created_at,
+                block_num=block_num,
+                trx_in_block=operation["trx_in_block"],
+                op_in_trx=operation["op_in_trx"],
+                virtual_op=operation["virtual_op"])
+
+            concrete_operation = _operation.sub_operation
+            actor, effected = None, None
+            if concrete_operation:
                 _operation.persist()
+                persisted.append(_operation)
+                actor = concrete_operation.actor
+                effected = concrete_operation.effected
+                touched_accounts.update([actor, effected])
+                mentions.known_accounts.add(actor, effected)
+
+            archived_operations.append({
+                "trx_id": operation["trx_id"],
+                "trx_in_block": operation["trx_in_block"],
+                "op_in_trx": operation["op_in_trx"],
+                "virtual_op": operation["virtual_op"],
+                "type": op_type,
+                "actor": actor,
+                "effected": effected,
+                "created_at": block.created_at,
+                "raw_data": op_value,
+            })
+
+        derived.write_rows(db, derived.extract_rows(persisted))
+        db.commit()
+
+        if self.archive and archived_operations:
+            self.archive.write_block(block_num, archived_operations)
+
+        cache.invalidate_accounts(touched_accounts)
+        if settings.RICHLIST_ENABLED:
+            richlist.mark_dirty(balance_accounts)
+        if settings.PUBSUB_ENABLED:
+            pubsub.publish_block(block_num, persisted)
+        metrics.BLOCKS_INGESTED.inc()
+        metrics.OPERATIONS_INGESTED.inc(len(persisted))
 
 
 def listen():
     logger.info('Starting Transaction Listener')
+    if settings.LISTENER_METRICS_PORT:
+        metrics.start_metrics_server(settings.LISTENER_METRICS_PORT)
     steem = get_steem_conn()
     tx_listener = TransactionListener(steem)
     tx_listener.run()
@@ -1,17 +1,19 @@
 from math import ceil
 
+import calendar
 import redis
 import json
 import requests
 import pymysql
 from flask import g
-from steem import Steem
 from steem.amount import Amount
 from pymongo import MongoClient
 from dateutil.parser import parse
-from datetime import datetime
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
 
-from . import settings
+from . import metrics, settings, state, tracing
+from .rpc import RPCRouter
 
 _steem_connection = None
 _mongo_connection = None
@@ -22,6 +24,8 @@ _redis_connection = None
 def connect_db():
     conn = pymysql.connect(*settings.DB_INFO, charset='utf8')
     conn.cursorclass = pymysql.cursors.DictCursor
+    if settings.TRACING_ENABLED:
+        conn.cursorclass = tracing.TracingCursor
     return conn
 
 
@@ -40,7 +44,10 @@ def get_db(new=False):
 def get_steem_conn():
     global _steem_connection
     if not _steem_connection:
-        _steem_connection = Steem(nodes=settings.NODES)
+        _steem_connection = metrics.InstrumentedSteem(
+            RPCRouter(settings.NODES, settings.RPC_CLIENT_OPTIONS))
+        if settings.TRACING_ENABLED:
+            _steem_connection = tracing.TracedSteem(_steem_connection)
     return _steem_connection
 
 
@@ -174,6 +181,63 @@ def vests_to_sp(vests, info):
     return vests / 1e6 * steem_per_mvests
 
 
+def get_delegations(steem, username):
+    outgoing_delegations = steem.get_vesting_delegations(username, 0, 100)
+    eight_days_ago = datetime.utcnow() - timedelta(days=8)
+    expiring_delegations = steem.get_expiring_vesting_delegations(
+        username,
+        eight_days_ago.strftime("%Y-%m-%dT%H:%M:%S"),
+        1000
+    )
+    info = state.load_state()
+    for outgoing_delegation in outgoing_delegations:
+        amount = Amount(outgoing_delegation["vesting_shares"]).amount
+        outgoing_delegation.update({
+            "min_delegation_time": parse(
+                outgoing_delegation["min_delegation_time"]),
+            "sp": round(vests_to_sp(amount, info), 2),
+            "vesting_shares": round(amount / 1e6, 4),
+        })
+
+    for expiring_delegation in expiring_delegations:
+        amount = Amount(expiring_delegation["vesting_shares"]).amount
+        expiring_delegation.update({
+            "expiration": parse(expiring_delegation["expiration"]),
+            "sp": round(vests_to_sp(amount, info), 2),
+            "vesting_shares": round(amount / 1e6, 4),
+        })
+
+    return outgoing_delegations, expiring_delegations
+
+
+def get_incoming_delegations(username):
+    collection = get_mongo_conn()["SteemData"]["Operations"]
+    info = state.load_state()
+
+    operations = collection.find({
+        "type": "delegate_vesting_shares",
+        "delegatee": username,
+    }).sort("timestamp")
+
+    delegation_map = {}
+    for delegation in operations:
+        delegation_map.update(
+            {delegation["delegator"]: delegation["vesting_shares"]["amount"]})
+
+    delegation_map = {k: float(v)
+                      for k, v in delegation_map.items() if float(v) > 0}
+
+    incoming_delegations = []
+    for from_account, vests in delegation_map.items():
+        incoming_delegations.append({
+            "from": from_account,
+            "sp": round(vests_to_sp(vests, info), 2),
+            "vesting_shares":  round(vests / 1e6, 4),
+        })
+
+    return incoming_delegations
+
+
 def get_curation_rewards(account, info, checkpoint_val=100):
     total_reward_in_rshares = 0
     total_reward_in_sp = 0
@@ -219,4 +283,75 @@ op_types = [
     "feed_publish",
     "delete_comment",
     "account_create_with_delegation",
+    "mention",
 ]
+
+history_directions = ["any", "actor", "effected"]
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value or "", "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def format_history_cursor(position):
+    """Operation.position as a query string value."""
+    return "-".join(
+        [str(calendar.timegm(position[0].timetuple()))] +
+        [str(value) for value in position[1:]])
+
+
+def parse_history_cursor(value):
+    try:
+        values = [int(part) for part in value.split("-")]
+    except (AttributeError, ValueError):
+        return None
+    if len(values) != 6:
+        return None
+    return tuple([datetime.utcfromtimestamp(values[0])] + values[1:])
+
+
+def history_filters(args):
+    """Account history filters out of the query string: op_type (can be
+    repeated), direction, from and to (YYYY-MM-DD, inclusive). Unknown
+    values are ignored."""
+    direction = args.get("direction")
+    return {
+        "op_types": sorted(set(
+            op_type for op_type in args.getlist("op_type")
+            if op_type in op_types)),
+        "direction": direction if direction in history_directions else "any",
+        "start_date": parse_date(args.get("from")),
+        "end_date": parse_date(args.get("to")),
+    }
+
+
+def matches_history_filters(operation, username, filters):
+    """Whether the profile page of username lists the operation with the
+    history filters."""
+    if filters["op_types"] and operation.type not in filters["op_types"]:
+        return False
+    if filters["direction"] == "actor" and operation.actor != username:
+        return False
+    if filters["direction"] == "effected" and \
+            operation.effected != username:
+        return False
+    created_at = operation.created_at.date()
+    if filters["start_date"] and created_at < filters["start_date"]:
+        return False
+    if filters["end_date"] and created_at > filters["end_date"]:
+        return False
+    return True
+
+
+def history_filters_query(filters):
+    params = [("op_type", op_type) for op_type in filters["op_types"]]
+    if filters["direction"] != "any":
+        params.append(("direction", filters["direction"]))
+    if filters["start_date"]:
+        params.append(("from", str(filters["start_date"])))
+    if filters["end_date"]:
+        params.append(("to", str(filters["end_date"])))
+    return urlencode(params)
@@ -0,0 +1,152 @@
+"""
+Voting power and vote value of many accounts, computed with numpy in a
+single pass.
+
+The reward fund and the median price change slowly, they are read from
+the node at most once per VOTE_INPUTS_CACHE_TTL and shared through the
+cache.
+"""
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+from steem.amount import Amount
+
+from . import cache, settings
+from .utils import get_db, get_steem_conn
+
+logger = logging.getLogger('steemrocks')
+
+# voting power regenerates from 0 to 100% in 5 days.
+VP_REGENERATION_SECONDS = 86400 * 5
+# a block every 3 seconds.
+BLOCKS_PER_DAY = 28800
+
+RANKING_KEY = "vote-value-ranking"
+
+
+def fetch_vote_inputs(steem):
+    price = steem.get_current_median_history_price()
+    reward_fund = steem.get_reward_fund('post')
+    return {
+        "base": Amount(price["base"]).amount,
+        "quote": Amount(price["quote"]).amount,
+        "reward_balance": Amount(reward_fund["reward_balance"]).amount,
+        "recent_claims": float(reward_fund["recent_claims"]),
+    }
+
+
+def get_vote_inputs(steem=None):
+    inputs = cache.get_cache().get("vote-inputs")
+    if inputs:
+        return json.loads(inputs)
+    inputs = fetch_vote_inputs(steem or get_steem_conn())
+    cache.get_cache().set(
+        "vote-inputs", json.dumps(inputs), settings.VOTE_INPUTS_CACHE_TTL)
+    return inputs
+
+
+def voting_power(voting_power, last_vote_time, now=None):
+    """Current voting power in percent. voting_power is the value stored
+    on the chain at last_vote_time, 0-10000."""
+    now = np.datetime64(now or datetime.utcnow(), "ms")
+    elapsed = (
+        now - np.asarray(last_vote_time, dtype="datetime64[ms]")
+    ).astype(float) / 1000
+    regenerated = elapsed * 10000 / VP_REGENERATION_SECONDS
+    return np.minimum(
+        np.asarray(voting_power, dtype=float) + regenerated, 10000) / 100
+
+
+def vote_value(vests, inputs, vp=100, weight=100):
+    """Value of a vote in SBD. vp and weight are in percent."""
+    vests = np.asarray(vests, dtype=float)
+    used_power = (100 * np.asarray(vp, dtype=float) *
+                  (100 * np.asarray(weight, dtype=float)) / 10000 + 49) / 50
+    return (vests * used_power * 100 *
+            inputs["reward_balance"] / inputs["recent_claims"] *
+            inputs["base"] / inputs["quote"])
+
+
+class VoteBatch(object):
+
+    def __init__(self, names, vests, stored_voting_power, last_vote_time,
+                 inputs, now=None):
+        self.names = list(names)
+        self.voting_power = voting_power(
+            stored_voting_power, last_vote_time, now=now)
+        self.full_vote_value = vote_value(vests, inputs)
+        self.current_vote_value = vote_value(
+            vests, inputs, vp=self.voting_power)
+
+    @classmethod
+    def from_accounts(cls, accounts, inputs, now=None):
+        """Builds the batch out of get_accounts results. Vote values use
+        the effective vests, delegations included."""
+        def vests(key):
+            return np.array([Amount(account[key]).amount
+                             for account in accounts], dtype=float)
+        return cls(
+            [account["name"] for account in accounts],
+            vests("vesting_shares") + vests("received_vesting_shares") -
+            vests("delegated_vesting_shares"),
+            [account["voting_power"] for account in accounts],
+            [account["last_vote_time"] for account in accounts],
+            inputs, now=now)
+
+    def top(self, count):
+        indexes = np.argsort(-self.full_vote_value)[:count]
+        return [{
+            "rank": rank,
+            "name": self.names[i],
+            "voting_power": round(float(self.voting_power[i]), 2),
+            "full_vote_value": round(float(self.full_vote_value[i]), 4),
+            "current_vote_value": round(float(self.current_vote_value[i]), 4),
+        } for rank, i in enumerate(indexes, 1)]
+
+
+def recent_voters(days, head_block_num):
+    """Voters of the blocks of the last days. The window is a block_num
+    range, so it is read through the primary key prefix."""
+    start_block = head_block_num - days * BLOCKS_PER_DAY
+    db = get_db(new=True)
+    try:
+        cursor = db.cursor()
+        cursor.execute(
+            "SELECT DISTINCT a.username FROM operations o "
+            "JOIN accounts_dict a ON a.id = o.actor_id "
+            "WHERE o.block_num > %s AND o.type = 'vote'", (start_block, ))
+        return [row["username"] for row in cursor]
+    finally:
+        db.close()
+
+
+def prepare_vote_value_ranking():
+    """Ranks the accounts which voted in the last VOTE_RANKING_DAYS by
+    the value of their full vote."""
+    steem = get_steem_conn()
+    inputs = fetch_vote_inputs(steem)
+    cache.get_cache().set(
+        "vote-inputs", json.dumps(inputs), settings.VOTE_INPUTS_CACHE_TTL)
+
+    usernames = recent_voters(
+        settings.VOTE_RANKING_DAYS,
+        steem.get_dynamic_global_properties()["head_block_number"])
+    accounts = []
+    chunk_size = settings.ACCOUNT_BATCH_SIZE
+    for i in range(0, len(usernames), chunk_size):
+        accounts.extend(account for account in steem.get_accounts(
+            usernames[i:i + chunk_size]) if account)
+    if not accounts:
+        return
+
+    batch = VoteBatch.from_accounts(accounts, inputs)
+    cache.get_cache().set(RANKING_KEY, json.dumps(
+        batch.top(settings.VOTE_RANKING_SIZE)))
+    logger.info('Ranked %s accounts by vote value.', len(accounts))
+
+
+def get_vote_value_ranking():
+    ranking = cache.get_cache().get(RANKING_KEY)
+    return json.loads(ranking) if ranking else []